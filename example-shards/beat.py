@@ -0,0 +1,36 @@
+# band energies with a flash on each onset, using the shared audio features
+import hidden_shades
+from pysicgl_utils import Display
+
+
+def frames(layer):
+    screen = layer.canvas.screen
+    display = Display(screen)
+    numx, numy = display.extent
+
+    flash = 0.0
+
+    while True:
+        yield None
+
+        features = hidden_shades.audio_manager.audio_source.features
+        bands = features.bands
+        num_bands = len(bands)
+
+        # flash the background on onsets and let it fade
+        if features.onset:
+            flash = 1.0
+        else:
+            flash *= 0.8
+        layer.canvas.interface_fill(layer.palette[0])
+        layer.canvas.interface_scale(flash)
+
+        # draw each band as a bar relative to the loudest band
+        loudest = max(bands)
+        if loudest <= 0.0:
+            continue
+        for idx in range(numx):
+            strength = bands[idx * num_bands // numx] / loudest
+            layer.canvas.interface_line(
+                0x00FFFFFF, (idx, 0), (idx, int(strength * numy))
+            )
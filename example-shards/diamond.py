@@ -85,6 +85,8 @@ def frames(layer):
 
         if name == "speed":
             timewarp.set_frequency(variable.value)
+            # the output does not change while the layer is not moving
+            layer.set_static(variable.value == 0)
         if name == "scale":
             compute_scalar_field()
         if name == "eccentricity":
@@ -10,20 +10,14 @@ def frames(layer):
     (numx, numy) = display.extent
     (maxx, maxy) = display.shape
 
-    # allocate a list to hold the fft results
-    strengths = [0.0] * numx
-
     while True:
         yield None
 
         audio_source = hidden_shades.audio_manager.audio_source
 
-        # # choose an fft output to view
-        # bins = audio_source.fft.output
-        bins = audio_source.reshaped_fft_output
-
-        # align the bins to the strenths (interpolate)
-        bins.align(strengths)
+        # the reshaped fft output mapped onto the columns of the display
+        # (this is the same as aligning audio_source.reshaped_fft_output)
+        strengths = audio_source.columns(numx)
 
         # clear the background
         layer.canvas.interface_fill(0xAA000000)
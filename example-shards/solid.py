@@ -2,6 +2,9 @@
 
 
 def frames(layer):
+    # the output only depends on the palette
+    layer.set_static(True)
+
     while True:
         yield None
 
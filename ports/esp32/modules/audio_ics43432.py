@@ -54,9 +54,7 @@ class ICS43432AudioSource(ManagedAudioSource):
             self._driver.readinto(self._buf)
 
             # format bytes into statically allocated floating point sample buffer
-            ics43432.bytes_to_float_buffer(self._buf, self._buffer)
-
-            # perform standard processsing
-            self.apply_volume()
-            self.fft.compute()
-            self.fft_postprocess()
+            # (a whole window is written at a time so the write index stays
+            # at the beginning of the ring)
+            ics43432.bytes_to_float_buffer(self._buf, self._ring)
+            self.mark_written(len(self._ring))
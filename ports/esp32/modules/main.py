@@ -8,6 +8,7 @@ import netman
 import csble
 import config
 import cache
+import persistence
 import board
 import hardware
 
@@ -233,6 +234,9 @@ async def run_pipeline():
         # frame generation is using up the full output period
         await asyncio.sleep(0)
 
+        # analyze the selected audio source when layers use it
+        hidden_shades.audio_manager.update()
+
         # zero the canvas to prevent artifacts from previous render loops from leaking through
         # (sometimes it would be beneficial to persist the previous state,
         # but shards can do that by allocating their own memory as needed)
@@ -255,7 +259,7 @@ async def run_pipeline():
 
             # composite the layer's canvas into the main canvas
             canvas.blend(board.display, visualizer_memory, layer.blending_mode)
-            visualizer.compose(board.display, canvas_memory, layer.composition_mode)
+            visualizer.compose(board.display, layer.memory, layer.composition_mode)
 
         # gamma correct the canvas
         pysicgl.gamma_correct(visualizer, corrected)
@@ -362,6 +366,7 @@ async def main():
     asyncio.create_task(poll_network_status())
     asyncio.create_task(blink())
     asyncio.create_task(artnet_provider.run())
+    asyncio.create_task(persistence.writer.run())
     if board.board_task is not None:
         asyncio.create_task(board.board_task())
 
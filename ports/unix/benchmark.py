@@ -0,0 +1,195 @@
+# headless benchmark of the render pipeline
+#
+# renders a fixed number of frames from a declared fixture as fast as
+# possible using a fake timebase clock and reports per-stage timings as
+# json so that runs may be compared across commits.
+#
+# usage: $EXEC benchmark.py <fixture.json> [output.json]
+import sys
+import json
+import random
+import config
+import pathutils
+
+# keep benchmark state separate from the runtime state of the instance
+# (this must happen before hidden_shades is imported)
+BENCHMARK_DIR = "dist/benchmark"
+try:
+    pathutils.rmdirr(BENCHMARK_DIR)
+except OSError:
+    pass
+config.EPHEMERAL_DIR = f"{BENCHMARK_DIR}/ephemeral"
+config.PERSISTENT_DIR = f"{BENCHMARK_DIR}/persistent"
+
+import pysicgl
+import hidden_shades
+from hidden_shades import globals
+from hidden_shades.layer import Layer
+from stack_manager import StackManager
+from pipeline import Pipeline, create_interface
+
+
+class FakeClock:
+    """
+    a clock which only advances when told to, one frame period at a time
+    """
+
+    def __init__(self, period_ms):
+        self._period_ms = period_ms
+        self._ms = 0
+
+    def ticks_ms(self):
+        return self._ms
+
+    def advance(self):
+        self._ms += self._period_ms
+
+
+def load_fixture(path):
+    with open(path, "r") as f:
+        fixture = json.load(f)
+
+    defaults = {
+        "name": path,
+        "width": 33,
+        "height": 32,
+        "frames": 300,
+        "warmup": 10,
+        "framerate": 30,
+        "seed": 0,
+        "shards": "../../example-shards",
+        "drivers": [],
+        "repeat": 1,
+        "render_threads": 0,
+        "layers": [],
+    }
+    defaults.update(fixture)
+    return defaults
+
+
+def load_drivers(names):
+    if names == "hardware":
+        import hardware
+
+        return hardware.drivers
+    drivers = []
+    for name in names:
+        if name == "udp":
+            from udpdriver import UDPDriver
+
+            drivers.append(UDPDriver("0.0.0.0", (6969, 6420)))
+        else:
+            raise ValueError(f"unknown driver '{name}'")
+    return drivers
+
+
+def add_layer(stack, layer_data, canvas, post_init_hook):
+    id, path, index = stack.get_new_layer_info()
+    layer = Layer(
+        id,
+        path,
+        canvas,
+        init_info=layer_data["config"],
+        post_init_hook=post_init_hook,
+    )
+    stack.add_layer(layer)
+
+    for variable_name, variable_value in layer_data.get("variables", {}).items():
+        variable = layer.variable_manager.variables[variable_name]
+        variable.value = variable.deserialize(variable_value)
+
+    standard_variables = layer_data.get("standardVariables", {})
+    for variable_name, variable_value in standard_variables.items():
+        variable = layer.private_variable_manager.variables[variable_name]
+        variable.value = variable.deserialize(variable_value)
+
+    return layer
+
+
+def run(fixture):
+    random.seed(fixture["seed"])
+
+    # drive all timewarps from the fake clock so that every run renders
+    # the same sequence of frames
+    clock = FakeClock(1000 / fixture["framerate"])
+    hidden_shades.timebase.set_reference(clock.ticks_ms)
+
+    # shards are imported by name from the fixture shard directory
+    sys.path.insert(0, fixture["shards"])
+
+    render_pool = None
+    if fixture["render_threads"] > 0:
+        from render_pool import RenderPool
+
+        render_pool = RenderPool(fixture["render_threads"])
+
+    def layer_post_init_hook(layer):
+        uuid = layer.info.get("shard_uuid")
+        if render_pool is not None and not layer.private_canvas:
+            layer.merge_info({"private_canvas": True})
+        layer.set_shard(__import__(uuid))
+        layer.initialize_frame_generator()
+
+    display = pysicgl.Screen((fixture["width"], fixture["height"]))
+    canvas, canvas_memory = create_interface(display)
+
+    def stack_initializer(id, path):
+        return Layer(id, path, canvas, post_init_hook=layer_post_init_hook)
+
+    stack_manager = StackManager(f"{config.EPHEMERAL_DIR}/stacks", stack_initializer)
+    for _ in range(fixture["repeat"]):
+        for layer_data in fixture["layers"]:
+            add_layer(stack_manager.active, layer_data, canvas, layer_post_init_hook)
+
+    def on_layer_exception(e):
+        raise e
+
+    pipeline = Pipeline(
+        display,
+        stack_manager,
+        load_drivers(fixture["drivers"]),
+        globals.variable_manager.variables["brightness"],
+        on_layer_exception=on_layer_exception,
+        history_length=fixture["frames"],
+        pool=render_pool,
+    )
+
+    # warm up so that one-time costs do not skew the results
+    for _ in range(fixture["warmup"]):
+        pipeline.render()
+        pipeline.push()
+        clock.advance()
+    pipeline.clear_profile()
+
+    for _ in range(fixture["frames"]):
+        pipeline.render()
+        pipeline.push()
+        clock.advance()
+
+    summary = pipeline.summary()
+    return {
+        "fixture": fixture["name"],
+        "display": [display.width, display.height],
+        "layers": len(stack_manager.active),
+        "frames": fixture["frames"],
+        "units": "us",
+        "stages": summary["stages"],
+        "frame": summary["total"],
+    }
+
+
+def main(argv):
+    if len(argv) < 2:
+        print("usage: benchmark.py <fixture.json> [output.json]")
+        sys.exit(1)
+
+    report = run(load_fixture(argv[1]))
+
+    if len(argv) > 2:
+        with open(argv[2], "w") as f:
+            json.dump(report, f)
+    else:
+        print(json.dumps(report))
+
+
+main(sys.argv)
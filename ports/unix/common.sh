@@ -13,3 +13,6 @@ export VARIANT_DIR=$SCRIPT_DIR/variants/$VARIANT
 
 # where the executable gets put by the micropython build system :/
 export EXEC=$MPY_UNIX_PORT_ROOT/build-$VARIANT/build-$VARIANT/micropython-dev
+
+# the cross compiler used to cache shard bytecode
+export MPY_CROSS=$MPY_ROOT/mpy-cross/build/mpy-cross
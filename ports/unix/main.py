@@ -1,19 +1,24 @@
 import uasyncio as asyncio
 import socket
-import time
+import os
 from microdot_asyncio import Microdot, Request, Response
 
 import cache
 import pysicgl
 import framerate
-import profiling
 import hardware
 import hidden_shades
 import pathutils
+import persistence
 import config
 
 from stack_manager import StackManager
+from shard import ShardManager, mpy_cross_compiler
+from pipeline import Pipeline, create_interface
+from scheduler import FrameScheduler
+from render_pool import RenderPool
 from hidden_shades.layer import Layer
+from hidden_shades.variables.responder import VariableResponder
 from hidden_shades import globals, artnet_provider
 from logging import LogManager
 
@@ -42,33 +47,62 @@ hw_config = cache.Cache(
 )
 
 
-# make pysicgl interfaces
-def create_interface(screen):
-    mem = pysicgl.allocate_pixel_memory(screen.pixels)
-    interface = pysicgl.Interface(screen, mem)
-    return (interface, mem)
-
-
 display = pysicgl.Screen((hw_config.get("width"), hw_config.get("height")))
-visualizer, visualizer_memory = create_interface(display)
-corrected, corrected_memory = create_interface(display)
 canvas, canvas_memory = create_interface(display)
 
 
+# layers may be rendered on multiple threads, in which case each layer
+# renders into its own canvas
+render_threads = hw_config.cache.get("render_threads", 0)
+render_pool = RenderPool(render_threads) if render_threads > 0 else None
+
+
+# shards are compiled into cached bytecode when mpy-cross is available
+# (see common.sh)
+mpy_cross = os.getenv("MPY_CROSS")
+shard_manager = ShardManager(
+    f"{config.PERSISTENT_DIR}/shards",
+    f"{config.PERSISTENT_DIR}/shard_store",
+    cache_path=f"{config.PERSISTENT_DIR}/shard_cache",
+    compiler=mpy_cross_compiler(mpy_cross) if mpy_cross else None,
+)
+
+
 # function to load a given shard uuid and return the module
 def load_shard(uuid):
-    return __import__(f"{config.PERSISTENT_DIR}/shards/{uuid}")
+    return shard_manager.get_shard_module(uuid)
 
 
-# a function which sets the shard for a given layer after
-# initialization
-def layer_post_init_hook(layer):
+# sets the shard for a given layer after initialization in steps which
+# may be interleaved with rendering
+def initialize_layer(layer):
     uuid = layer.info.get("shard_uuid")
+
+    # compiling a shard which is not in the bytecode cache is the slowest step
+    shard_manager.compile_shard(uuid)
+    yield
+
     shard = load_shard(uuid)
+    yield
+
+    # the render pool only renders layers with a private canvas
+    # (the choice is recorded so that changes to the info keep it)
+    if render_pool is not None and not layer.private_canvas:
+        layer.merge_info({"private_canvas": True})
     layer.set_shard(shard)
+    yield
+
+    # run the setup code of the shard, which declares its variables
     layer.initialize_frame_generator()
 
 
+# a function which sets the shard for a given layer after
+# initialization
+def layer_post_init_hook(layer):
+    for _ in initialize_layer(layer):
+        pass
+
+
 # a function called for each layer in the stack upon creation
 # this allows the program to keep the details of loading shards
 # separate from the job of the Stack class
@@ -76,85 +110,79 @@ def stack_initializer(id, path):
     return Layer(id, path, canvas, post_init_hook=layer_post_init_hook)
 
 
+# the state of each stack may be kept in a single log file rather than
+# one file per value
+if hw_config.cache.get("state_store", "files") == "log":
+    for name in ("A", "B"):
+        persistence.mount(persistence.LogStore(f"{config.EPHEMERAL_DIR}/stacks/{name}"))
+
 # define stacks
-stack_manager = StackManager(f"{config.EPHEMERAL_DIR}/stacks", stack_initializer)
+# (layers are loaded once the pipeline is running, starting with the
+# active stack, so that output begins without waiting for every shard)
+stack_manager = StackManager(
+    f"{config.EPHEMERAL_DIR}/stacks", stack_initializer, lazy=True
+)
 
 
 frate = framerate.FramerateHistory()
 
 
-async def run_pipeline():
-    # make a timer for profiling the framerate
-    profiler = profiling.ProfileTimer()
+# the render pipeline
+pipeline = Pipeline(
+    display,
+    stack_manager,
+    hardware.drivers,
+    globals.variable_manager.variables["brightness"],
+    on_layer_exception=logger.log_exception,
+    pool=render_pool,
+    audio_manager=hidden_shades.audio_manager,
+)
+
+
+# schedules output frames at the rate set by the global framerate variable
+framerate_variable = globals.variable_manager.variables["framerate"]
+scheduler = FrameScheduler(framerate_variable.value)
 
-    # rate-limit the output
-    output_event = asyncio.Event()
 
-    async def rate_limiter(frequency):
-        period_ms = 1000 / frequency
+# transitions between stacks render two stacks per frame, which should
+# still fit within the frame period
+def handle_framerate_change(variable):
+    scheduler.set_frequency(variable.value)
+    pipeline.set_transition_budget(int(1000000 / variable.value))
 
-        next_frame_ms = time.ticks_ms() + period_ms
+
+handle_framerate_change(framerate_variable)
+framerate_variable.add_responder(VariableResponder(handle_framerate_change))
+
+
+async def run_pipeline():
+    # the renderer waits for each frame to be taken by the output before
+    # rendering the next one
+    frame_taken = asyncio.Event()
+
+    # push frames out to the drivers at the frame rate set by the global
+    # framerate variable
+    async def output():
+        scheduler.reset()
         while True:
-            # wait for next time
-            while time.ticks_ms() < next_frame_ms:
-                await asyncio.sleep(0)
+            await scheduler.wait()
 
-            # signal
-            output_event.set()
-            next_frame_ms += period_ms
+            # output the latest frame and let rendering of the next one begin
+            pipeline.push()
+            frame_taken.set()
 
-    FRAMERATE = 30
-    asyncio.create_task(rate_limiter(FRAMERATE))
+    asyncio.create_task(output())
 
     # handle layers
     while True:
-        profiler.set()
-
-        # zero the visualizer to prevent artifacts from previous render loops
-        # from leaking through
-        visualizer.interface_fill(pysicgl.ALPHA_TRANSPARENCY_FULL | 0x000000)
-
-        # loop over all layers in the active stack manager
-        for layer in stack_manager.active:
-            # only compute active layers
-            if layer.active:
-                # zero the layer interface for each shard
-                # (if a layer wants to use persistent memory it can do whacky stuff
-                # such as allocating its own local interface and copying out the results)
-                canvas.interface_fill(pysicgl.ALPHA_TRANSPARENCY_FULL | 0x000000)
-
-                # run the layer
-                try:
-                    layer.run()
-                except Exception as e:
-                    logger.log_exception(e)
-                    layer.set_active(False)
-
-                # # blending is broken right now
-                # canvas.blend(display, visualizer_memory, layer.blending_mode)
-
-                # compose the canvas memory onto the visualizer memory
-                visualizer.compose(display, canvas_memory, layer.composition_mode)
-
-        # gamma correct the canvas
-        pysicgl.gamma_correct(visualizer, corrected)
-
-        # apply global brightness
-        corrected.interface_scale(
-            globals.variable_manager.variables["brightness"].value
-        )
-
-        # output the display data
-        for driver in hardware.drivers:
-            driver.push(corrected)
+        pipeline.render()
 
         # compute framerate
-        profiler.mark()
-        frate.record_period_ms(profiler.period_ms)
+        frate.record_period_ms(pipeline.period_ms)
 
-        # wait for the next output opportunity
-        await output_event.wait()
-        output_event.clear()
+        # wait for the frame to be taken by the output
+        await frame_taken.wait()
+        frame_taken.clear()
 
 
 async def serve_api():
@@ -164,20 +192,35 @@ async def serve_api():
     init_api_app(
         stack_manager,
         canvas,
-        layer_post_init_hook,
+        initialize_layer,
+        shard_manager,
+        pipeline,
     )
 
     # set up server
     PORT = 1337
 
     # configure maximum request size
-    Request.max_content_length = 128 * 1024  # 128 KB
+    # (bodies larger than the body length are not read into memory and
+    # may only be streamed, e.g. shard uploads)
+    Request.max_content_length = shard_manager.max_size
+    Request.max_body_length = 128 * 1024  # 128 KB
     Response.default_content_type = "application/json"
 
     # create application structure
     app = Microdot()
     app.mount(api_app, url_prefix="/api/v0")
 
+    # only shard uploads are streamed, every other route reads its body
+    # from memory and so must reject bodies which were not read
+    @app.before_request
+    async def limit_body(request):
+        if request.content_length <= Request.max_body_length:
+            return None
+        if request.method == "PUT" and request.path.startswith("/api/v0/shards/"):
+            return None
+        return {"error": "request body too large"}, 413
+
     @app.get("/alive")
     async def get_alive(request):
         return None
@@ -222,7 +265,9 @@ async def control_visualizer():
 async def blink():
     while True:
         await asyncio.sleep(5)
-        print(f"{frate.average()} fps, ({len(stack_manager.active)} layers)")
+        print(
+            f"{frate.average()} fps, ({len(stack_manager.active)} layers, {scheduler.missed} missed)"
+        )
 
 
 async def main():
@@ -230,10 +275,12 @@ async def main():
 
     # create async tasks
     asyncio.create_task(run_pipeline())
+    asyncio.create_task(stack_manager.load())
     asyncio.create_task(control_visualizer())
     asyncio.create_task(serve_api())
     asyncio.create_task(blink())
     asyncio.create_task(artnet_provider.run())
+    asyncio.create_task(persistence.writer.run())
 
     # start audio sources
     for source in hardware.audio_sources:
@@ -250,4 +297,8 @@ async def main():
 
 
 # run asyncio scheduler
-asyncio.run(main())
+# (pending writes are flushed when the program exits)
+try:
+    asyncio.run(main())
+finally:
+    persistence.writer.flush()
@@ -28,10 +28,9 @@ class MockAudioSource(ManagedAudioSource):
 
         while True:
             # simulate waiting for a real audio source to fill the buffer
+            # (a whole window is written at a time so the write index stays
+            # at the beginning of the ring)
             for idx in range(self._sample_length):
-                self._buffer[idx] = next(sine_generator)
+                self._ring[idx] = next(sine_generator)
+            self.mark_written(self._sample_length)
             await asyncio.sleep(self._sample_length / self._sample_frequency)
-
-            self.apply_volume()
-            self.fft.compute()
-            self.fft_postprocess()
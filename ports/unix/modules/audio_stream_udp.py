@@ -1,10 +1,11 @@
 import uasyncio as asyncio
 from hidden_shades.audio.source import ManagedAudioSource
 import socket
-from collections import deque
 
 
 class UDPAudioSource(ManagedAudioSource):
+    BYTES_PER_SAMPLE = 4
+
     def __init__(self, path, name, network_config, audio_config):
         super().__init__(path, name, audio_config)
 
@@ -12,11 +13,11 @@ class UDPAudioSource(ManagedAudioSource):
         self._host, self._port = network_config
 
         # create a buffer to receive data from the socket connection
-        self._BYTES_PER_SAMPLE = 4
-        self._udp_buffer = bytearray(self._BYTES_PER_SAMPLE * self._sample_length)
-
-        # create a deque to streamline operations
-        self._queue = deque((), self._sample_length)
+        # (a partial sample at the end of a read is kept at the beginning
+        # of the buffer until the rest of it arrives)
+        self._udp_buffer = bytearray(self.BYTES_PER_SAMPLE * self._sample_length)
+        self._udp_view = memoryview(self._udp_buffer)
+        self._partial = 0
 
     async def run(self):
         sock = None
@@ -49,7 +50,7 @@ class UDPAudioSource(ManagedAudioSource):
                         raise error
 
             # read data into the buffer
-            bytes_read = sock.readinto(self._udp_buffer)
+            bytes_read = sock.readinto(self._udp_view[self._partial :])
 
             # check for broken connection
             if bytes_read == 0:
@@ -58,34 +59,14 @@ class UDPAudioSource(ManagedAudioSource):
                     print("ERROR: UDP audio connection broken, resetting...")
                     sock.close()
                     sock = None
+                    self._partial = 0
                     continue
 
-            # convert data into samples in deque
-            samples_read = int(bytes_read / self._BYTES_PER_SAMPLE)
-            for idx in range(samples_read):
-                sample = int.from_bytes(
-                    self._udp_buffer[
-                        self._BYTES_PER_SAMPLE
-                        * (idx) : self._BYTES_PER_SAMPLE
-                        * (idx + 1)
-                    ],
-                    "little",
-                )
-                self._queue.append(sample)
-
-            # check available data length
-            available_samples = len(self._queue)
-            if available_samples < self._sample_length:
-                # if we don't have a full sample set then continue
-                print(
-                    f"waiting for {self._sample_length - available_samples} more samples"
-                )
-                continue
-
-            # consume the samples
-            for idx in range(self._sample_length):
-                self._buffer[idx] = self._queue.popleft()
+            # decode the whole samples straight into the sample buffer
+            available = self._partial + bytes_read
+            whole = available - available % self.BYTES_PER_SAMPLE
+            self.write_samples(self._udp_view[:whole], self.BYTES_PER_SAMPLE)
 
-            self.apply_volume()
-            self.fft.compute()
-            self.fft_postprocess()
+            # keep any partial sample for the next read
+            self._partial = available - whole
+            self._udp_view[: self._partial] = self._udp_view[whole:available]
@@ -0,0 +1,357 @@
+import time
+import pysicgl
+from profiling import StageProfiler, ProfileHistory
+from hidden_shades.layer import Layer
+from transition import Crossfade
+
+# stages of the render pipeline which are individually profiled
+STAGE_FILL = 0
+STAGE_LAYER = 1
+STAGE_COMPOSE = 2
+STAGE_GAMMA = 3
+STAGE_SCALE = 4
+STAGE_TRANSITION = 5
+STAGE_AUDIO = 6
+STAGES = ("fill", "layer", "compose", "gamma", "scale", "transition", "audio")
+
+# the stages to which the time spent rendering a stack is attributed
+STACK_STAGES = (STAGE_FILL, STAGE_LAYER, STAGE_COMPOSE)
+TRANSITION_STAGES = (STAGE_TRANSITION, STAGE_TRANSITION, STAGE_TRANSITION)
+
+
+# make pysicgl interfaces
+def create_interface(screen):
+    mem = pysicgl.allocate_pixel_memory(screen.pixels)
+    interface = pysicgl.Interface(screen, mem)
+    return (interface, mem)
+
+
+class FrameHandoff:
+    """
+    A pair of output interfaces which decouples rendering from output.
+
+    Rendering writes into the back interface and commits it as a complete
+    frame. The output takes the latest complete frame at each deadline and
+    repeats it until another frame is committed. The renderer should wait
+    for a committed frame to be taken before rendering the next one.
+    """
+
+    def __init__(self, display):
+        self._interfaces = tuple(create_interface(display)[0] for _ in range(2))
+        self._front = None
+        self._ready = False
+
+    def acquire(self):
+        """
+        the interface into which the next frame should be rendered
+        """
+        return self._interfaces[1 if self._front == 0 else 0]
+
+    def commit(self):
+        """
+        mark the acquired interface as the latest complete frame
+        """
+        self._ready = True
+
+    def take(self):
+        """
+        take the latest complete frame for output, or the previous frame
+        when no new frame is complete. returns None before any frame has
+        been completed.
+        """
+        if self._ready:
+            self._front = 1 if self._front == 0 else 0
+            self._ready = False
+        if self._front is None:
+            return None
+        return self._interfaces[self._front]
+
+
+class Pipeline:
+    """
+    Renders the active stack of a StackManager into a gamma corrected
+    interface and pushes the result out to the display drivers.
+
+    Rendering and output are separate steps so that they can be run by
+    separate tasks. Completed frames are handed from one to the other
+    through a FrameHandoff.
+    """
+
+    def __init__(
+        self,
+        display,
+        stack_manager,
+        drivers,
+        brightness,
+        on_layer_exception=None,
+        history_length=64,
+        pool=None,
+        transition_budget_us=None,
+        audio_manager=None,
+    ):
+        self._display = display
+        self._stack_manager = stack_manager
+        self._drivers = drivers
+        self._brightness = brightness
+        self._on_layer_exception = on_layer_exception
+
+        # the selected audio source is analyzed at most once per frame, and
+        # only when the layers of the previous frame used its results
+        self._audio_manager = audio_manager
+
+        # layers with private canvases may be rendered concurrently by a
+        # RenderPool before being composed in stack order
+        self._pool = pool
+
+        self.visualizer, self._visualizer_memory = create_interface(display)
+        self._frames = FrameHandoff(display)
+
+        # buffers used only while crossfading between stacks
+        self._transition = None
+        self._transition_interface = None
+        self._transition_memory = None
+        self._blend_interface = None
+        self._blend_memory = None
+        self._transition_budget_us = transition_budget_us
+        self._target_rendered = False
+
+        self._profiler = StageProfiler(STAGES, history_length)
+        self._push_history = ProfileHistory(history_length)
+        self._last_period_us = 0
+
+    def render(self):
+        """
+        render one frame and hand it off to the output
+        """
+        profiler = self._profiler
+        corrected = self._frames.acquire()
+
+        profiler.begin()
+
+        if self._audio_manager is not None:
+            self._audio_manager.update()
+            profiler.mark(STAGE_AUDIO)
+
+        # a finished transition leaves its target as the active stack
+        transition = self._transition
+        if transition is not None and transition.done:
+            self._stack_manager.activate(transition.target.id)
+            self._transition = transition = None
+
+        if transition is None:
+            self._render_stack(
+                self._stack_manager.active,
+                self.visualizer,
+                self._visualizer_memory,
+                STACK_STAGES,
+            )
+        else:
+            self._render_stack(
+                transition.source,
+                self.visualizer,
+                self._visualizer_memory,
+                STACK_STAGES,
+            )
+            self._render_transition(transition)
+
+        # gamma correct the canvas
+        pysicgl.gamma_correct(self.visualizer, corrected)
+        profiler.mark(STAGE_GAMMA)
+
+        # apply global brightness
+        corrected.interface_scale(self._brightness.value)
+        profiler.mark(STAGE_SCALE)
+
+        # hand the frame off to the output
+        self._frames.commit()
+
+        profiler.end()
+        self._last_period_us = profiler.period_us
+
+    def _render_stack(self, stack, visualizer, visualizer_memory, stages):
+        """
+        render and compose the layers of a stack into the given interface,
+        attributing the time spent to the given (fill, layer, compose)
+        profiling stages
+        """
+        profiler = self._profiler
+        stage_fill, stage_layer, stage_compose = stages
+
+        # start from the cached composite of the static layers at the bottom
+        # of the stack when it is available, otherwise zero the visualizer to
+        # prevent artifacts from previous render loops from leaking through
+        start = stack.cached_prefix_length()
+        if start > 0:
+            visualizer_memory[:] = stack.prefix_memory
+        else:
+            visualizer.interface_fill(pysicgl.ALPHA_TRANSPARENCY_FULL | 0x000000)
+        profiler.mark(stage_fill)
+
+        # render the layers which have private canvases in parallel
+        pooled = self._pool is not None
+        if pooled:
+            jobs = list(
+                stack[idx]
+                for idx in range(start, len(stack))
+                if stack[idx].active and stack[idx].private_canvas
+            )
+            for layer, e in self._pool.render(jobs):
+                self._handle_layer_exception(layer, e)
+            profiler.mark(stage_layer)
+
+        # the cached prefix may be extended for as long as the layers above
+        # it are active static layers
+        extending = True
+
+        # loop over the remaining layers in the stack
+        for idx in range(start, len(stack)):
+            layer = stack[idx]
+
+            # only compute active layers which were not rendered by the pool
+            if layer.active and not (pooled and layer.private_canvas):
+                # zero the layer interface for each shard
+                # (layers with a private canvas may opt out of clearing to
+                # persist their previous output)
+                # static layers with valid cached output are not rendered so
+                # there is no need to clear the canvas for them
+                if layer.clears_canvas and not layer.cached:
+                    layer.canvas.interface_fill(
+                        pysicgl.ALPHA_TRANSPARENCY_FULL | 0x000000
+                    )
+                profiler.mark(stage_fill)
+
+                # run the layer
+                try:
+                    layer.run()
+                except Exception as e:
+                    self._handle_layer_exception(layer, e)
+                profiler.mark(stage_layer)
+
+            # remember the composite below the first layer which can not be cached
+            if extending and not (layer.active and layer.cached):
+                extending = False
+                if idx > start:
+                    stack.store_prefix(visualizer_memory, idx)
+                    profiler.mark(stage_fill)
+
+            if layer.active:
+                # # blending is broken right now
+                # canvas.blend(display, visualizer_memory, layer.blending_mode)
+
+                # compose the canvas memory onto the visualizer memory
+                layer_profiler = layer.profiler
+                layer_profiler.skip()
+                visualizer.compose(self._display, layer.memory, layer.composition_mode)
+                layer_profiler.mark(Layer.PROFILE_COMPOSE)
+                layer_profiler.end()
+                profiler.mark(stage_compose)
+
+        # the whole stack may be static
+        if extending and len(stack) > start:
+            stack.store_prefix(visualizer_memory, len(stack))
+            profiler.mark(stage_fill)
+
+    def _render_transition(self, transition):
+        """
+        render the target stack of a transition and blend it into the
+        visualizer, which holds the source stack
+        """
+        if self._transition_interface is None:
+            (
+                self._transition_interface,
+                self._transition_memory,
+            ) = create_interface(self._display)
+            self._blend_interface, self._blend_memory = create_interface(self._display)
+
+        # rendering a second stack may not fit in the frame budget, in which
+        # case the target is only rendered every other frame
+        over_budget = (
+            self._transition_budget_us is not None
+            and self._last_period_us > self._transition_budget_us
+        )
+        if not (over_budget and self._target_rendered):
+            self._render_stack(
+                transition.target,
+                self._transition_interface,
+                self._transition_memory,
+                TRANSITION_STAGES,
+            )
+            self._target_rendered = True
+        else:
+            self._target_rendered = False
+
+        # mix the stacks in proportion to the progress of the transition
+        progress = transition.progress()
+        self.visualizer.interface_scale(1.0 - progress)
+        self._blend_memory[:] = self._transition_memory
+        self._blend_interface.interface_scale(progress)
+        self.visualizer.compose(
+            self._display,
+            self._blend_memory,
+            Layer.COMPOSITION_MODES["channelwise_sum_clamped"],
+        )
+        self._profiler.mark(STAGE_TRANSITION)
+
+    def start_transition(self, target_id, duration_ms, curve="linear"):
+        """
+        crossfade from the active stack to the given stack, which becomes
+        the active stack once the transition is complete
+        """
+        # a transition which is already running is completed first
+        if self._transition is not None:
+            self._stack_manager.activate(self._transition.target.id)
+            self._transition = None
+
+        source = self._stack_manager.active
+        target = self._stack_manager.stacks[target_id]
+        if target is source:
+            raise ValueError("the stack is already active")
+        self._transition = Crossfade(source, target, duration_ms, curve)
+
+    def cancel_transition(self):
+        """
+        stop the running transition, if any, without activating its target
+        """
+        self._transition = None
+
+    def set_transition_budget(self, budget_us):
+        self._transition_budget_us = budget_us
+
+    @property
+    def transition(self):
+        return self._transition
+
+    def _handle_layer_exception(self, layer, e):
+        if self._on_layer_exception is not None:
+            self._on_layer_exception(e)
+        layer.set_active(False)
+
+    def push(self):
+        """
+        output the latest complete frame to the display drivers
+        """
+        interface = self._frames.take()
+        if interface is None:
+            return
+
+        t = time.ticks_us()
+        for driver in self._drivers:
+            driver.push(interface)
+        self._push_history.record(time.ticks_diff(time.ticks_us(), t))
+
+    def clear_profile(self):
+        self._profiler.clear()
+        self._push_history.clear()
+
+    def summary(self):
+        summary = self._profiler.summary()
+        summary["stages"]["push"] = self._push_history.summary()
+        return summary
+
+    @property
+    def profiler(self):
+        return self._profiler
+
+    @property
+    def period_ms(self):
+        return self._profiler.period_us / 1000
@@ -0,0 +1,83 @@
+import _thread
+import pysicgl
+
+
+class RenderPool:
+    """
+    Renders independent layers concurrently on worker threads.
+
+    Each layer rendered by the pool must have a private canvas. The calling
+    thread takes part in rendering and render() returns once every layer
+    has been rendered, so composition can proceed in stack order afterwards.
+
+    Layers only render in parallel when the interpreter is built without a
+    global interpreter lock (MICROPY_PY_THREAD_GIL=0), otherwise the
+    threads take turns. Shards rendered by the pool must not share mutable
+    state with other shards.
+    """
+
+    def __init__(self, threads):
+        self._lock = _thread.allocate_lock()
+        self._jobs = []
+        self._next = 0
+        self._errors = []
+
+        # each worker waits on its start lock and releases its done lock
+        # once there are no more jobs
+        self._workers = []
+        for _ in range(threads):
+            start = _thread.allocate_lock()
+            done = _thread.allocate_lock()
+            start.acquire()
+            done.acquire()
+            self._workers.append((start, done))
+            _thread.start_new_thread(self._worker, (start, done))
+
+    def _take_job(self):
+        self._lock.acquire()
+        idx = self._next
+        self._next += 1
+        self._lock.release()
+        if idx < len(self._jobs):
+            return self._jobs[idx]
+        return None
+
+    def _work(self):
+        while True:
+            layer = self._take_job()
+            if layer is None:
+                return
+
+            try:
+                if layer.clears_canvas and not layer.cached:
+                    layer.canvas.interface_fill(
+                        pysicgl.ALPHA_TRANSPARENCY_FULL | 0x000000
+                    )
+                layer.run()
+            except Exception as e:
+                self._lock.acquire()
+                self._errors.append((layer, e))
+                self._lock.release()
+
+    def _worker(self, start, done):
+        while True:
+            start.acquire()
+            self._work()
+            done.release()
+
+    def render(self, layers):
+        """
+        render the given layers and return a list of (layer, exception)
+        pairs for any layers which raised an exception
+        """
+        self._jobs = layers
+        self._next = 0
+        self._errors = []
+
+        for start, _ in self._workers:
+            start.release()
+        self._work()
+        for _, done in self._workers:
+            done.acquire()
+
+        return self._errors
@@ -0,0 +1,80 @@
+import time
+import uasyncio as asyncio
+
+
+class FrameScheduler:
+    """
+    Waits for evenly spaced frame deadlines without busy waiting.
+
+    The task sleeps until shortly before each deadline and then yields to
+    other tasks until the deadline passes, which corrects for the
+    millisecond resolution of the asyncio sleep. Deadlines are advanced in
+    whole microseconds while the fractional remainder of the period is
+    carried forward so that the schedule does not drift.
+    """
+
+    def __init__(self, frequency, margin_us=1000):
+        self._margin_us = margin_us
+        self._missed = 0
+        self.reset()
+        self.set_frequency(frequency)
+
+    def reset(self):
+        """
+        start the schedule from the present time
+        """
+        self._deadline = time.ticks_us()
+
+    def set_frequency(self, frequency):
+        """
+        set the target frame rate in Hz, taking effect from the next deadline
+        """
+        if frequency <= 0:
+            raise ValueError
+        self._frequency = frequency
+
+        # the period is expressed as a ratio of integers in millihertz so
+        # that it may be advanced exactly
+        self._frequency_mhz = int(frequency * 1000)
+        self._period_us = 1000000000 // self._frequency_mhz
+        self._remainder = 1000000000 % self._frequency_mhz
+        self._error = 0
+
+    def _advance(self):
+        period = self._period_us
+        self._error += self._remainder
+        if self._error >= self._frequency_mhz:
+            self._error -= self._frequency_mhz
+            period += 1
+        self._deadline = time.ticks_add(self._deadline, period)
+
+    async def wait(self):
+        """
+        wait for the next frame deadline
+        """
+        self._advance()
+
+        # deadlines which have already passed by more than a full period
+        # are counted as missed and skipped rather than rushed through
+        late = time.ticks_diff(time.ticks_us(), self._deadline)
+        while late > self._period_us:
+            self._missed += 1
+            self._advance()
+            late = time.ticks_diff(time.ticks_us(), self._deadline)
+
+        # sleep through most of the remaining time
+        remaining = -late - self._margin_us
+        if remaining > 0:
+            await asyncio.sleep_ms(remaining // 1000)
+
+        # then yield until the deadline passes
+        while time.ticks_diff(self._deadline, time.ticks_us()) > 0:
+            await asyncio.sleep(0)
+
+    @property
+    def frequency(self):
+        return self._frequency
+
+    @property
+    def missed(self):
+        return self._missed
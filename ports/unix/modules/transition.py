@@ -0,0 +1,74 @@
+import time
+
+
+def ease_in_out(t):
+    return t * t * (3 - 2 * t)
+
+
+def ease_in(t):
+    return t * t
+
+
+def ease_out(t):
+    return t * (2 - t)
+
+
+# curves map the elapsed fraction of a transition to the fraction of the
+# target which is shown
+CURVES = {
+    "linear": lambda t: t,
+    "ease": ease_in_out,
+    "ease_in": ease_in,
+    "ease_out": ease_out,
+}
+
+
+class Crossfade:
+    """
+    A crossfade from one stack to another over a fixed duration.
+    """
+
+    def __init__(self, source, target, duration_ms, curve="linear"):
+        if duration_ms <= 0:
+            raise ValueError
+        self._curve = CURVES[curve]
+        self._curve_name = curve
+        self._source = source
+        self._target = target
+        self._duration_ms = int(duration_ms)
+        self._start = time.ticks_ms()
+
+    def elapsed(self):
+        """
+        the fraction of the duration which has elapsed, from 0 to 1
+        """
+        elapsed = time.ticks_diff(time.ticks_ms(), self._start)
+        return min(max(elapsed / self._duration_ms, 0.0), 1.0)
+
+    def progress(self):
+        """
+        the fraction of the target which should be shown, from 0 to 1
+        """
+        return self._curve(self.elapsed())
+
+    @property
+    def done(self):
+        return self.elapsed() >= 1.0
+
+    @property
+    def source(self):
+        return self._source
+
+    @property
+    def target(self):
+        return self._target
+
+    @property
+    def info(self):
+        return {
+            "from": self._source.id,
+            "to": self._target.id,
+            "duration_ms": self._duration_ms,
+            "curve": self._curve_name,
+            "progress": self.elapsed(),
+        }
@@ -146,6 +146,253 @@ STATIC mp_obj_t align(mp_obj_t self_in, mp_obj_t output_obj) {
 }
 STATIC MP_DEFINE_CONST_FUN_OBJ_2(align_obj, align);
 
+/**
+ * @brief Decodes little endian signed integer samples from a bytes-like object
+ * into the buffer. Samples are written starting at the given index and wrap
+ * around to the beginning of the buffer when its end is reached.
+ *
+ * @param n_args
+ * @param args self, data, bytes per sample, (optional) start index
+ * @return the index following the last sample written
+ */
+STATIC mp_obj_t decode(size_t n_args, const mp_obj_t* args) {
+  FloatBuffer_obj_t* self = MP_OBJ_TO_PTR(args[0]);
+
+  mp_buffer_info_t data;
+  mp_get_buffer_raise(args[1], &data, MP_BUFFER_READ);
+  const uint8_t* pdata = (const uint8_t*)data.buf;
+
+  mp_int_t width = mp_obj_get_int(args[2]);
+  if ((width < 1) || (width > 4)) {
+    mp_raise_ValueError(NULL);
+  }
+
+  mp_int_t start = 0;
+  if (n_args > 3) {
+    start = mp_obj_get_int(args[3]);
+  }
+  if ((start < 0) || ((size_t)start >= self->length)) {
+    mp_raise_ValueError(NULL);
+  }
+
+  // samples are sign extended from the most significant bit of their width
+  uint32_t sign = ((uint32_t)1) << (8 * width - 1);
+  size_t num_samples = data.len / width;
+  size_t idx = (size_t)start;
+  for (size_t sample_idx = 0; sample_idx < num_samples; sample_idx++) {
+    const uint8_t* psample = &pdata[sample_idx * width];
+    uint32_t raw = 0;
+    for (mp_int_t byte_idx = 0; byte_idx < width; byte_idx++) {
+      raw |= ((uint32_t)psample[byte_idx]) << (8 * byte_idx);
+    }
+    int32_t sample = (int32_t)((raw ^ sign) - sign);
+
+    self->elements[idx] = (float)sample;
+    idx++;
+    if (idx >= self->length) {
+      idx = 0;
+    }
+  }
+
+  return mp_obj_new_int(idx);
+}
+STATIC MP_DEFINE_CONST_FUN_OBJ_VAR_BETWEEN(decode_obj, 3, 4, decode);
+
+/**
+ * @brief Copies the elements of another buffer into this buffer. Elements
+ * are read starting at the given index of the source, wrapping around to the
+ * beginning of the source when its end is reached, so that the contents of a
+ * ring buffer may be copied out in order.
+ *
+ * @param n_args
+ * @param args self, source, (optional) start index in the source
+ * @return None
+ */
+STATIC mp_obj_t copy(size_t n_args, const mp_obj_t* args) {
+  FloatBuffer_obj_t* self = MP_OBJ_TO_PTR(args[0]);
+  if (!mp_obj_is_type(args[1], &FloatBuffer_type)) {
+    mp_raise_TypeError(NULL);
+  }
+  FloatBuffer_obj_t* source = MP_OBJ_TO_PTR(args[1]);
+
+  if (0 == source->length) {
+    mp_raise_ValueError(NULL);
+  }
+
+  mp_int_t start = 0;
+  if (n_args > 2) {
+    start = mp_obj_get_int(args[2]);
+  }
+  if ((start < 0) || ((size_t)start >= source->length)) {
+    mp_raise_ValueError(NULL);
+  }
+
+  size_t idx = (size_t)start;
+  for (size_t element_idx = 0; element_idx < self->length; element_idx++) {
+    self->elements[element_idx] = source->elements[idx];
+    idx++;
+    if (idx >= source->length) {
+      idx = 0;
+    }
+  }
+
+  return mp_const_none;
+}
+STATIC MP_DEFINE_CONST_FUN_OBJ_VAR_BETWEEN(copy_obj, 2, 3, copy);
+
+/**
+ * @brief Measures the level of the buffer.
+ *
+ * @param self_in
+ * @return a tuple of the root mean square and the peak absolute value of the
+ * elements
+ */
+STATIC mp_obj_t levels(mp_obj_t self_in) {
+  FloatBuffer_obj_t* self = MP_OBJ_TO_PTR(self_in);
+
+  double sum_of_squares = 0.0;
+  float peak = 0.0f;
+  for (size_t idx = 0; idx < self->length; idx++) {
+    float value = self->elements[idx];
+    sum_of_squares += (double)value * value;
+    value = fabsf(value);
+    if (value > peak) {
+      peak = value;
+    }
+  }
+
+  double rms = 0.0;
+  if (self->length > 0) {
+    rms = sqrt(sum_of_squares / self->length);
+  }
+
+  mp_obj_t items[2];
+  items[0] = mp_obj_new_float((mp_float_t)rms);
+  items[1] = mp_obj_new_float((mp_float_t)peak);
+  return mp_obj_new_tuple(2, items);
+}
+STATIC MP_DEFINE_CONST_FUN_OBJ_1(levels_obj, levels);
+
+/**
+ * @brief Averages consecutive ranges of the buffer into the elements of the
+ * output. The ranges are given by a sequence of edges, one more than the
+ * length of the output, so that output element n is the mean of the elements
+ * in [edges[n], edges[n + 1]). Empty ranges produce zero.
+ *
+ * @param self_in
+ * @param edges_obj
+ * @param output_obj a FloatBuffer
+ * @return None
+ */
+STATIC mp_obj_t band_means(mp_obj_t self_in, mp_obj_t edges_obj,
+                           mp_obj_t output_obj) {
+  FloatBuffer_obj_t* self = MP_OBJ_TO_PTR(self_in);
+  if (!mp_obj_is_type(output_obj, &FloatBuffer_type)) {
+    mp_raise_TypeError(NULL);
+  }
+  FloatBuffer_obj_t* output = MP_OBJ_TO_PTR(output_obj);
+
+  size_t num_edges = 0;
+  mp_obj_t* edges = NULL;
+  mp_obj_get_array(edges_obj, &num_edges, &edges);
+  if (num_edges != output->length + 1) {
+    mp_raise_ValueError(NULL);
+  }
+
+  for (size_t idx = 0; idx < output->length; idx++) {
+    mp_int_t start = mp_obj_get_int(edges[idx]);
+    mp_int_t end = mp_obj_get_int(edges[idx + 1]);
+    if (start < 0) {
+      start = 0;
+    }
+    if (end > (mp_int_t)self->length) {
+      end = self->length;
+    }
+
+    double sum = 0.0;
+    for (mp_int_t element_idx = start; element_idx < end; element_idx++) {
+      sum += (double)self->elements[element_idx];
+    }
+    output->elements[idx] = (end > start) ? (float)(sum / (end - start)) : 0.0f;
+  }
+
+  return mp_const_none;
+}
+STATIC MP_DEFINE_CONST_FUN_OBJ_3(band_means_obj, band_means);
+
+/**
+ * @brief Multiplies the buffer by a sparse matrix. The rows of the matrix are
+ * stored in compressed form: the entries of row n are found in the index and
+ * weight arrays in the range [starts[n], starts[n + 1]). Element n of the
+ * output is the weighted sum of the buffer elements at the indices of row n.
+ *
+ * @param n_args
+ * @param args self, starts (array 'I'), indices (array 'H'), weights (array
+ * 'f'), output FloatBuffer, (optional) floor below which elements of the
+ * buffer are ignored
+ * @return None
+ */
+STATIC mp_obj_t project(size_t n_args, const mp_obj_t* args) {
+  FloatBuffer_obj_t* self = MP_OBJ_TO_PTR(args[0]);
+
+  mp_buffer_info_t starts;
+  mp_buffer_info_t indices;
+  mp_buffer_info_t weights;
+  mp_get_buffer_raise(args[1], &starts, MP_BUFFER_READ);
+  mp_get_buffer_raise(args[2], &indices, MP_BUFFER_READ);
+  mp_get_buffer_raise(args[3], &weights, MP_BUFFER_READ);
+  if ((starts.typecode != 'I') || (indices.typecode != 'H') ||
+      (weights.typecode != 'f')) {
+    mp_raise_TypeError(NULL);
+  }
+  const unsigned int* pstarts = (const unsigned int*)starts.buf;
+  const uint16_t* pindices = (const uint16_t*)indices.buf;
+  const float* pweights = (const float*)weights.buf;
+
+  if (!mp_obj_is_type(args[4], &FloatBuffer_type)) {
+    mp_raise_TypeError(NULL);
+  }
+  FloatBuffer_obj_t* output = MP_OBJ_TO_PTR(args[4]);
+
+  bool use_floor = false;
+  mp_float_t floor = 0.0;
+  if ((n_args > 5) && (args[5] != mp_const_none)) {
+    use_floor = true;
+    floor = mp_obj_get_float(args[5]);
+  }
+
+  size_t num_entries = indices.len / sizeof(uint16_t);
+  if ((starts.len / sizeof(unsigned int) != output->length + 1) ||
+      (weights.len / sizeof(float) != num_entries)) {
+    mp_raise_ValueError(NULL);
+  }
+
+  for (size_t row = 0; row < output->length; row++) {
+    size_t begin = pstarts[row];
+    size_t end = pstarts[row + 1];
+    if ((end < begin) || (end > num_entries)) {
+      mp_raise_ValueError(NULL);
+    }
+
+    double sum = 0.0;
+    for (size_t entry = begin; entry < end; entry++) {
+      size_t idx = pindices[entry];
+      if (idx >= self->length) {
+        continue;
+      }
+      float value = self->elements[idx];
+      if (use_floor && (value <= floor)) {
+        continue;
+      }
+      sum += (double)pweights[entry] * value;
+    }
+    output->elements[row] = (float)sum;
+  }
+
+  return mp_const_none;
+}
+STATIC MP_DEFINE_CONST_FUN_OBJ_VAR_BETWEEN(project_obj, 5, 6, project);
+
 /**
  * @brief Make a reference to this buffer.
  * It is illegal to destroy the memory allocated for a buffer, as there is no
@@ -361,6 +608,11 @@ STATIC const mp_rom_map_elem_t locals_dict_table[] = {
     {MP_ROM_QSTR(MP_QSTR_scale), MP_ROM_PTR(&scale_obj)},
     {MP_ROM_QSTR(MP_QSTR_output), MP_ROM_PTR(&output_obj)},
     {MP_ROM_QSTR(MP_QSTR_align), MP_ROM_PTR(&align_obj)},
+    {MP_ROM_QSTR(MP_QSTR_decode), MP_ROM_PTR(&decode_obj)},
+    {MP_ROM_QSTR(MP_QSTR_copy), MP_ROM_PTR(&copy_obj)},
+    {MP_ROM_QSTR(MP_QSTR_levels), MP_ROM_PTR(&levels_obj)},
+    {MP_ROM_QSTR(MP_QSTR_band_means), MP_ROM_PTR(&band_means_obj)},
+    {MP_ROM_QSTR(MP_QSTR_project), MP_ROM_PTR(&project_obj)},
 };
 STATIC MP_DEFINE_CONST_DICT(locals_dict, locals_dict_table);
 
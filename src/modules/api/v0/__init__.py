@@ -1,7 +1,7 @@
 from microdot_asyncio import Microdot
 from semver import SemanticVersion
 
-from .shards import shards_app
+from .shards import shards_app, init_shards_app
 from .output import output_app, init_output_app
 from .globals import globals_app
 from .audio import audio_app
@@ -11,9 +11,12 @@ api_version = SemanticVersion.from_semver("0.0.0")
 api_app = Microdot()
 
 
-def init_api_app(stack_manager, canvas, layer_post_init_hook):
+def init_api_app(
+    stack_manager, canvas, initialize_layer, shard_manager, transitions=None
+):
     # a sorta ugly way to pass local data into the stacks app...
-    init_output_app(stack_manager, canvas, layer_post_init_hook)
+    init_output_app(stack_manager, canvas, initialize_layer, shard_manager, transitions)
+    init_shards_app(shard_manager, stack_manager)
 
     api_app.mount(shards_app, url_prefix="/shards")
     api_app.mount(output_app, url_prefix="/output")
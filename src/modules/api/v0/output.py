@@ -1,15 +1,20 @@
 from microdot_asyncio import Microdot
+import uasyncio as asyncio
 import json
+import sys
 
 from hidden_shades.layer import Layer
+from stack import Stack
 
 output_app = Microdot()
 
 
 def stack_response(stack):
+    # only the layers which have been loaded are listed
     layers = list(str(layer.id) for layer in stack)
     return {
         "id": stack.id,
+        "loaded": stack.loaded,
         "layers": {
             "total": len(layers),
             "ids": layers,
@@ -17,30 +22,77 @@ def stack_response(stack):
     }
 
 
+def stack_loading_response(stack):
+    return {"error": f"stack {stack.id} is still loading"}, 503
+
+
 def layer_response(layer):
     return {
         "variables": layer.variable_manager.info,
         "standardVariables": layer.private_variable_manager.info,
         "config": layer.info,
+        "state": layer.state,
     }
 
 
-def init_output_app(stack_manager, canvas, layer_post_init_hook):
-    def add_layer_to_stack(stack, layer_data, canvas, layer_post_init_hook):
+def init_output_app(
+    stack_manager, canvas, initialize_layer, shard_manager=None, transitions=None
+):
+    """
+    initialize_layer is a generator function which prepares a new layer
+    (e.g. imports its shard and initializes its frame generator) and
+    yields between steps so that rendering may continue in between
+
+    transitions, when given, starts transitions between stacks with
+    start_transition(stack_id, duration_ms, curve), stops them with
+    cancel_transition() and reports the running transition (or None)
+    through its transition property
+    """
+
+    def shard_hash(uuid):
+        if shard_manager is None:
+            return None
+        try:
+            return shard_manager.shard_hash(uuid)
+        except OSError:
+            return None
+
+    def find_layer(stack, layer_id, ready=False):
         """
-        add a layer to the stack
+        returns the layer with the given id and None, or None and an error
+        response when there is no such layer (yet)
+        when ready is True layers which are still pending are refused, since
+        they have no position in the stack and their shard may not have
+        declared its variables yet
         """
-        layer_config = layer_data["config"]
-        id, path, index = stack.get_new_layer_info()
-        layer = Layer(
-            id,
-            path,
-            canvas,
-            init_info=layer_config,
-            post_init_hook=layer_post_init_hook,
-        )
-        stack.add_layer(layer)
+        try:
+            layer = stack.get_layer_by_id(str(layer_id))
+        except KeyError:
+            layer = None
+        if layer is not None:
+            if ready and stack.is_reserved(layer):
+                return None, (
+                    {
+                        "error": f"layer {layer_id} is still pending",
+                        "state": layer.state,
+                    },
+                    409,
+                )
+            return layer, None
+        reason = stack.get_failure(str(layer_id))
+        if reason is not None:
+            return None, (
+                {
+                    "error": f"layer {layer_id} failed: {reason}",
+                    "state": Layer.STATE_FAILED,
+                },
+                404,
+            )
+        if not stack.loaded:
+            return None, stack_loading_response(stack)
+        return None, ({"error": f"layer {layer_id} not found"}, 404)
 
+    def set_layer_variables(layer, layer_data):
         # initialize variable values
         try:
             variables = layer_data["variables"]
@@ -59,7 +111,53 @@ def init_output_app(stack_manager, canvas, layer_post_init_hook):
         except KeyError:
             pass
 
-        return layer
+    async def prepare_layers(stack, pending, replace):
+        """
+        prepare pending layers outside of the request handler, yielding to
+        the render loop between steps, then insert them into the stack
+        together once all of them are ready
+        if any layer fails to initialize none of the layers are inserted
+        layers which are removed while they are prepared are skipped (their
+        storage is gone, so nothing more may be written for them)
+        """
+        try:
+            for layer, layer_data in pending:
+                if not stack.is_reserved(layer):
+                    continue
+                for _ in initialize_layer(layer):
+                    await asyncio.sleep(0)
+                    if not stack.is_reserved(layer):
+                        break
+                else:
+                    set_layer_variables(layer, layer_data)
+                    await asyncio.sleep(0)
+        except Exception as e:
+            sys.print_exception(e)
+            layers = list(layer for layer, _ in pending)
+            for layer in layers:
+                layer.set_failed()
+            stack.discard_reserved_layers(layers, f"{type(e).__name__}: {e}")
+            return
+
+        # the layers are swapped into the stack in one step between frames
+        stack.add_reserved_layers(list(layer for layer, _ in pending), replace)
+
+    def add_layers_to_stack(stack, layers_data, replace=False):
+        """
+        create layers which are prepared off to the side and inserted into
+        the stack together once they are all ready
+        returns the pending layers
+        """
+        pending = []
+        for layer_data in layers_data:
+            layer_config = layer_data["config"]
+            id, path, index = stack.get_new_layer_info()
+            layer = Layer(id, path, canvas, init_info=layer_config)
+            stack.reserve_layer(layer)
+            pending.append((layer, layer_data))
+
+        asyncio.create_task(prepare_layers(stack, pending, replace))
+        return list(layer for layer, _ in pending)
 
     @output_app.get("")
     async def get_output_index(request):
@@ -74,6 +172,43 @@ def init_output_app(stack_manager, canvas, layer_post_init_hook):
             },
         }
 
+    @output_app.get("/transition")
+    async def get_transition(request):
+        """
+        get information about the running transition, if any
+        """
+        if transitions is None:
+            return {"error": "transitions are not supported"}, 404
+        transition = transitions.transition
+        return {
+            "active": stack_manager.info.get("active"),
+            "transition": transition.info if transition is not None else None,
+        }
+
+    @output_app.put("/transition")
+    async def put_transition(request):
+        """
+        crossfade from the active stack to another stack
+        """
+        if transitions is None:
+            return {"error": "transitions are not supported"}, 404
+        data = json.loads(request.body.decode())
+        duration_ms = data.get("duration_ms", 1000)
+        if isinstance(duration_ms, bool) or not isinstance(duration_ms, (int, float)):
+            return {"error": "duration_ms must be a number"}, 400
+        try:
+            transitions.start_transition(
+                data["stack"],
+                duration_ms,
+                data.get("curve", "linear"),
+            )
+        except (KeyError, ValueError) as e:
+            return {"error": str(e)}, 400
+        return {
+            "active": stack_manager.info.get("active"),
+            "transition": transitions.transition.info,
+        }
+
     @output_app.get("/stack/<stack_id>")
     def get_stack(request, stack_id):
         """
@@ -82,13 +217,65 @@ def init_output_app(stack_manager, canvas, layer_post_init_hook):
         stack = stack_manager.stacks[stack_id]
         return stack_response(stack)
 
+    @output_app.get("/stack/<stack_id>/profile")
+    async def get_stack_profile(request, stack_id):
+        """
+        get rolling render timings for each layer in the stack
+        """
+        stack = stack_manager.stacks[stack_id]
+        return {
+            "id": stack.id,
+            "units": "us",
+            "layers": dict((str(layer.id), layer.profile) for layer in stack),
+        }
+
+    @output_app.get("/stack/<stack_id>/snapshot")
+    async def get_stack_snapshot(request, stack_id):
+        """
+        get a snapshot of all layers in the stack
+        """
+        stack = stack_manager.stacks[stack_id]
+        if not stack.loaded:
+            return stack_loading_response(stack)
+        return stack.snapshot(shard_hash)
+
+    @output_app.put("/stack/<stack_id>/snapshot")
+    async def put_stack_snapshot(request, stack_id):
+        """
+        replace all layers in the stack with those of a snapshot
+        """
+        snapshot = json.loads(request.body.decode())
+        if snapshot.get("version") != Stack.SNAPSHOT_VERSION:
+            return {"error": "unsupported snapshot version"}, 400
+
+        # the shards must be the same as when the snapshot was taken
+        layers_data = snapshot["layers"]
+        for layer_data in layers_data:
+            expected = layer_data.get("shard_hash")
+            uuid = layer_data["config"]["shard_uuid"]
+            if expected is not None and shard_hash(uuid) != expected:
+                return {"error": f"shard {uuid} does not match the snapshot"}, 409
+
+        # the layers replace the existing ones in a single step once ready
+        stack = stack_manager.stacks[stack_id]
+        if not stack.loaded:
+            return stack_loading_response(stack)
+        layers = add_layers_to_stack(stack, layers_data, replace=True)
+        response = stack_response(stack)
+        response["pending"] = list(str(layer.id) for layer in layers)
+        return response
+
     @output_app.put("/stack/<stack_id>/activate")
     def activate_stack(request, stack_id):
         """
         activate the given stack id
+        a running transition is cancelled so that it can not activate its
+        target stack once it completes
         """
-        stack_manager.activate(stack_id)
         stack = stack_manager.stacks[stack_id]
+        if transitions is not None:
+            transitions.cancel_transition()
+        stack_manager.activate(stack_id)
         return stack_response(stack)
 
     @output_app.get("/stack/<stack_id>/layers")
@@ -132,6 +319,8 @@ def init_output_app(stack_manager, canvas, layer_post_init_hook):
         remove all layers from the stack
         """
         stack = stack_manager.stacks[stack_id]
+        if not stack.loaded:
+            return stack_loading_response(stack)
         stack.clear_layers()
         return stack_response(stack)
 
@@ -141,16 +330,23 @@ def init_output_app(stack_manager, canvas, layer_post_init_hook):
         add multiple layers to the stack
         """
         data = json.loads(request.body.decode())
+        if isinstance(data, dict):
+            data = data["layers"]
         stack = stack_manager.stacks[stack_id]
-        for layer_data in data:
-            add_layer_to_stack(stack, layer_data, canvas, layer_post_init_hook)
-
-        return stack_response(stack)
+        if not stack.loaded:
+            return stack_loading_response(stack)
+        replace = request.args.get("replace") in ("1", "true")
+        layers = add_layers_to_stack(stack, data, replace)
+        response = stack_response(stack)
+        response["pending"] = list(str(layer.id) for layer in layers)
+        return response
 
     @output_app.get("/stack/<stack_id>/layer/<layer_id>")
     async def get_layer_info(request, stack_id, layer_id):
         stack = stack_manager.stacks[stack_id]
-        layer = stack.get_layer_by_id(str(layer_id))
+        layer, error = find_layer(stack, layer_id)
+        if error is not None:
+            return error
         return layer_response(layer)
 
     @output_app.post("/stack/<stack_id>/layer")
@@ -160,7 +356,9 @@ def init_output_app(stack_manager, canvas, layer_post_init_hook):
         """
         layer_data = json.loads(request.body.decode())
         stack = stack_manager.stacks[stack_id]
-        layer = add_layer_to_stack(stack, layer_data, canvas, layer_post_init_hook)
+        if not stack.loaded:
+            return stack_loading_response(stack)
+        (layer,) = add_layers_to_stack(stack, [layer_data])
         return layer_response(layer)
 
     @output_app.delete("/stack/<stack_id>/layer/<layer_id>")
@@ -169,6 +367,11 @@ def init_output_app(stack_manager, canvas, layer_post_init_hook):
         remove a layer from the stack
         """
         stack = stack_manager.stacks[stack_id]
+        if not stack.loaded:
+            return stack_loading_response(stack)
+        _, error = find_layer(stack, layer_id)
+        if error is not None:
+            return error
         stack.remove_layer_by_id(str(layer_id))
         return {
             "status": "ok",
@@ -181,7 +384,16 @@ def init_output_app(stack_manager, canvas, layer_post_init_hook):
         """
         data = json.loads(request.body.decode())
         stack = stack_manager.stacks[stack_id]
-        layer = stack.get_layer_by_id(str(layer_id))
+        if not stack.loaded:
+            return stack_loading_response(stack)
+        layer, error = find_layer(stack, layer_id, ready=True)
+        if error is not None:
+            return error
+
+        # the index is the position of the layer in the stack
+        if "index" in data:
+            stack.move_layer_to_index(str(layer_id), int(data.pop("index")))
+
         layer.merge_info(data)
         return layer_response(layer)
 
@@ -191,7 +403,9 @@ def init_output_app(stack_manager, canvas, layer_post_init_hook):
         get variable info
         """
         stack = stack_manager.stacks[stack_id]
-        layer = stack.get_layer_by_id(str(layer_id))
+        layer, error = find_layer(stack, layer_id, ready=True)
+        if error is not None:
+            return error
         variable = layer.variable_manager.variables[variable_id]
         return variable.get_dict()
 
@@ -202,7 +416,9 @@ def init_output_app(stack_manager, canvas, layer_post_init_hook):
         """
         data = json.loads(request.body.decode())
         stack = stack_manager.stacks[stack_id]
-        layer = stack.get_layer_by_id(str(layer_id))
+        layer, error = find_layer(stack, layer_id, ready=True)
+        if error is not None:
+            return error
         variable = layer.variable_manager.variables[variable_id]
         variable.value = variable.deserialize(data["value"])
         return variable.get_dict()
@@ -212,7 +428,9 @@ def init_output_app(stack_manager, canvas, layer_post_init_hook):
     )
     async def get_layer_private_variable_info(request, stack_id, layer_id, variable_id):
         stack = stack_manager.stacks[stack_id]
-        layer = stack.get_layer_by_id(str(layer_id))
+        layer, error = find_layer(stack, layer_id)
+        if error is not None:
+            return error
         variable = layer.private_variable_manager.variables[variable_id]
         return variable.get_dict()
 
@@ -225,7 +443,9 @@ def init_output_app(stack_manager, canvas, layer_post_init_hook):
         """
         data = json.loads(request.body.decode())
         stack = stack_manager.stacks[stack_id]
-        layer = stack.get_layer_by_id(str(layer_id))
+        layer, error = find_layer(stack, layer_id, ready=True)
+        if error is not None:
+            return error
         variable = layer.private_variable_manager.variables[variable_id]
         variable.value = variable.deserialize(data["value"])
         return variable.get_dict()
@@ -1,22 +1,52 @@
 from microdot_asyncio import Microdot
-import os
-import config
 
 shards_app = Microdot()
 
+# the ShardManager which stores shards and the StackManager whose layers
+# use them (set by init_shards_app)
+shard_manager = None
+stack_manager = None
 
-def shardEdgeByName(name):
+
+def shardEdgeByName(name, refcounts):
+    hash = shard_manager.shard_hash(name)
     return {
         "node": {
             "name": f"{name}",
+            "hash": hash,
+            "size": shard_manager.shard_size(name),
+            "refcount": refcounts.get(hash, 0),
         },
         "cursor": f"{name}",
     }
 
 
+def init_shards_app(shards, stacks):
+    global shard_manager, stack_manager
+    shard_manager = shards
+    stack_manager = stacks
+
+
+def count_shard_references():
+    """
+    count the layers which use each distinct shard (by content hash)
+    (layers which are still being loaded after boot are not counted)
+    """
+    refcounts = {}
+    for stack in stack_manager.stacks.values():
+        for layer in stack.get_layers():
+            uuid = layer.info.get("shard_uuid")
+            try:
+                hash = shard_manager.shard_hash(uuid)
+            except OSError:
+                continue
+            refcounts[hash] = refcounts.get(hash, 0) + 1
+    return refcounts
+
+
 @shards_app.get("")
 async def get_shards(request):
-    shard_names = list(os.listdir(f"{config.PERSISTENT_DIR}/shards"))
+    shard_names = list(shard_manager.shards)
     total = len(shard_names)
 
     if total == 0:
@@ -30,7 +60,8 @@ async def get_shards(request):
         }
 
     # compute the edges
-    edges = list(map(lambda name: shardEdgeByName(name), shard_names))
+    refcounts = count_shard_references()
+    edges = list(map(lambda name: shardEdgeByName(name, refcounts), shard_names))
 
     # return the data
     return {
@@ -44,13 +75,27 @@ async def get_shards(request):
 
 
 # curl -H "Content-Type: text/plain" -X PUT http://localhost:1337/shards/<uuid> -d $'def frames(l):\n\twhile True:\n\t\tyield None\n\t\tprint("hello world")\n\n'
+# (append ?sha256=<hex digest> to have the upload verified)
 @shards_app.put("/<uuid>")
 async def put_shard(request, uuid):
     # shards are immutable once published, therefore if the specified UUID
-    # exists on the filesystem it does not need to be written again
-    path = f"{config.PERSISTENT_DIR}/shards/{uuid}"
+    # is already stored it does not need to be written again
+    # (the shard is compiled into cached bytecode so that adding a layer
+    # which uses it does not stall rendering)
+    # the body is streamed to storage so that its size is not limited by
+    # the heap
+    if not request.content_length:
+        return {"error": "content length required"}, 411
+    if request.content_length > shard_manager.max_size:
+        return {"error": "shard too large"}, 413
     try:
-        os.stat(path)
-    except:
-        with open(path, "w") as f:
-            f.write(request.body)
+        await shard_manager.receive_shard(
+            uuid,
+            request.stream,
+            request.content_length,
+            request.args.get("sha256"),
+        )
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    except OSError as e:
+        return {"error": str(e)}, 500
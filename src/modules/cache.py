@@ -1,28 +1,32 @@
 import json
-from pathutils import ensure_parent_dirs
+from persistence import store_for
 
 
 class Cache:
     """
     Cache storage backed by filesystem.
     Nested dictionaries not allowed.
+
+    Writes are coalesced unless the cache is synchronous, which is meant for
+    structural records that must not be lost when power is cut.
     """
 
-    def __init__(self, path, initial_values={}, on_change=None):
+    def __init__(self, path, initial_values={}, on_change=None, sync=False):
         self._path = path
+        self._store = store_for(path)
+        self._sync = sync
         self._on_change = on_change
         self._cache = initial_values
 
         # try to load existing file
-        # if failed then make sure dirs exist for initial storage
+        # if failed then make sure dirs exist and store the initial values
+        # (values which were loaded are already stored)
         try:
             self.load()
         except OSError:
-            ensure_parent_dirs(path)
+            self._store.prepare_parent(path)
             self.notify()
-
-        # store initial values
-        self.store()
+            self.store()
 
     def set_change_handler(self, on_change):
         """
@@ -46,13 +50,22 @@ class Cache:
                         self._cache[key] = corrected
 
     def load(self):
-        with open(self._path, "r") as f:
-            self._cache = json.load(f)
+        serialized = self._store.load(self._path)
+        if serialized is None:
+            raise OSError
+        self._cache = json.loads(serialized)
         self.notify()
 
+    def _serialize(self):
+        return json.dumps(self._cache)
+
     def store(self):
-        with open(self._path, "w") as f:
-            json.dump(self._cache, f)
+        """
+        Schedule the cache to be written to its store.
+        Repeated changes are coalesced until the store is flushed, unless
+        the cache is synchronous.
+        """
+        self._store.save(self._path, self._serialize, self._sync)
 
     def get(self, name):
         return self._cache[name]
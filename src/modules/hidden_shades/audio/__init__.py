@@ -1,2 +1,4 @@
 from .source import AudioSource
+from .features import AudioFeatures
+from .filterbank import Filterbank
 from .manager import AudioManager
@@ -0,0 +1,179 @@
+import time
+from array import array
+from buffer import FloatBuffer
+
+
+class AudioFeatures:
+    """
+    Features of an audio source which are computed once per analysis so
+    that every layer can read the same results.
+
+    - rms and peak level of the samples
+    - the mean magnitude of the spectrum in log spaced bands
+    - spectral flux (the increase in the band magnitudes since the previous
+      analysis) and onsets, which are detected when the flux rises above
+      its recent average
+    - the tempo and the phase of the beat, estimated from the intervals
+      between onsets
+
+    The results are held in buffers which are allocated once.
+    """
+
+    # onsets are detected when the flux exceeds its recent average by this
+    # factor, at most once per minimum interval
+    ONSET_THRESHOLD = 1.5
+    ONSET_MIN_INTERVAL_MS = 100
+    FLUX_AVERAGE_WEIGHT = 0.1
+
+    # beats are expected between 40 and 200 bpm
+    MIN_BEAT_MS = 300
+    MAX_BEAT_MS = 1500
+    BEAT_TOLERANCE = 0.2
+    BEAT_AVERAGE_WEIGHT = 0.2
+    BEAT_MISSES = 4
+
+    def __init__(
+        self,
+        sample_frequency,
+        window_length,
+        num_bands=8,
+        min_frequency=40.0,
+    ):
+        # log spaced band edges in bins of the spectrum
+        # (each band holds at least one bin where there are enough bins)
+        bins = window_length // 2
+        bin_width = sample_frequency / window_length
+        ratio = (sample_frequency / 2) / min_frequency
+        edges = []
+        for idx in range(num_bands + 1):
+            frequency = min_frequency * ratio ** (idx / num_bands)
+            edge = int(frequency / bin_width + 0.5)
+            if idx > 0:
+                edge = max(edge, edges[-1] + 1)
+            edges.append(min(edge, bins))
+        self._edges = tuple(edges)
+
+        self._bands = FloatBuffer(num_bands)
+        self._previous_bands = array("f", [0.0] * num_bands)
+
+        self._rms = 0.0
+        self._peak = 0.0
+        self._flux = 0.0
+        self._flux_average = 0.0
+        self._onset = False
+        self._last_onset = None
+
+        self._beat_period_ms = 0
+        self._beat_misses = 0
+        self._last_beat = None
+        self._beat_phase = 0.0
+
+    def update(self, samples, spectrum, scale=1.0):
+        """
+        computes the features from a window of samples (in any order) and
+        its magnitude spectrum. scale is applied to the sample levels.
+        """
+        now = time.ticks_ms()
+
+        rms, peak = samples.levels()
+        self._rms = rms * scale
+        self._peak = peak * scale
+
+        bands = self._bands
+        previous = self._previous_bands
+        spectrum.band_means(self._edges, bands)
+        flux = 0.0
+        for idx in range(len(previous)):
+            value = bands[idx]
+            if value > previous[idx]:
+                flux += value - previous[idx]
+            previous[idx] = value
+        self._flux = flux
+
+        # detect onsets against the recent average of the flux
+        self._onset = (
+            flux > 0.0
+            and flux > self._flux_average * AudioFeatures.ONSET_THRESHOLD
+            and (
+                self._last_onset is None
+                or time.ticks_diff(now, self._last_onset)
+                >= AudioFeatures.ONSET_MIN_INTERVAL_MS
+            )
+        )
+        self._flux_average += (flux - self._flux_average) * (
+            AudioFeatures.FLUX_AVERAGE_WEIGHT
+        )
+
+        if self._onset:
+            self._track_beat(now)
+            self._last_onset = now
+
+        if self._beat_period_ms > 0:
+            elapsed = time.ticks_diff(now, self._last_beat)
+            self._beat_phase = (elapsed % self._beat_period_ms) / self._beat_period_ms
+
+    def _track_beat(self, now):
+        """
+        refines the beat period with the interval since the previous onset
+        """
+        if self._last_onset is None:
+            return
+        interval = time.ticks_diff(now, self._last_onset)
+        period = self._beat_period_ms
+
+        # the interval may span several beats
+        if period > 0:
+            beats = int(interval / period + 0.5)
+            if beats > 0 and abs(interval - beats * period) <= (
+                period * AudioFeatures.BEAT_TOLERANCE
+            ):
+                self._beat_period_ms = period + int(
+                    (interval / beats - period) * AudioFeatures.BEAT_AVERAGE_WEIGHT
+                )
+                self._beat_misses = 0
+                self._last_beat = now
+                return
+
+        # adopt a new period once the onsets consistently disagree with it
+        if AudioFeatures.MIN_BEAT_MS <= interval <= AudioFeatures.MAX_BEAT_MS:
+            self._beat_misses += 1
+            if period == 0 or self._beat_misses >= AudioFeatures.BEAT_MISSES:
+                self._beat_period_ms = interval
+                self._beat_misses = 0
+                self._last_beat = now
+
+    @property
+    def rms(self):
+        return self._rms
+
+    @property
+    def peak(self):
+        return self._peak
+
+    @property
+    def bands(self):
+        return self._bands
+
+    @property
+    def flux(self):
+        return self._flux
+
+    @property
+    def onset(self):
+        return self._onset
+
+    @property
+    def tempo(self):
+        """
+        the estimated tempo in beats per minute, or zero when unknown
+        """
+        if self._beat_period_ms == 0:
+            return 0.0
+        return 60000 / self._beat_period_ms
+
+    @property
+    def beat_phase(self):
+        """
+        the fraction of the current beat which has elapsed, from 0 to 1
+        """
+        return self._beat_phase
@@ -0,0 +1,76 @@
+from array import array
+
+
+class Filterbank:
+    """
+    A precomputed mapping of the bins of a spectrum onto a number of columns.
+
+    The mapping is the same as reshaping the spectrum with the given factor
+    (see the reshape module), selecting the window of reshaped bins and
+    aligning the window to the columns. Each of those steps is linear, so
+    they are combined into a sparse matrix of weights which is applied in a
+    single step. The matrix only depends on its parameters, so it is built
+    once and applied to every spectrum.
+    """
+
+    # bin indices are stored in 16 bits
+    MAX_BINS = 65536
+
+    def __init__(self, num_bins, reshape_factor, window, width):
+        if num_bins > Filterbank.MAX_BINS:
+            raise ValueError(f"at most {Filterbank.MAX_BINS} bins are supported")
+        window_min, window_max = window
+
+        # the range of spectrum bins summed into each reshaped bin
+        # (a reshaped bin repeats the previous sum until its range grows)
+        ranges = []
+        progress = 0.0
+        low = 0
+        high = 0
+        for idx in range(window_max):
+            progress += pow(idx + 1, reshape_factor) - pow(idx, reshape_factor)
+            if int(progress) > high:
+                low = high
+                high = int(progress)
+            ranges.append((min(low, num_bins), min(high, num_bins)))
+        ranges = ranges[window_min:window_max]
+
+        # the reshaped bins (and their weights) interpolated into each column
+        length = len(ranges)
+        starts = [0]
+        indices = []
+        weights = []
+        for column in range(width):
+            contributions = []
+            if length == 1:
+                contributions.append((0, 1.0))
+            elif length > 1:
+                center = column * (length - 1) / (width - 1) if width > 1 else 0
+                lower = int(center)
+                delta = center - lower
+                contributions.append((lower, 1.0 - delta))
+                if delta > 0.0:
+                    contributions.append((lower + 1, delta))
+
+            row = {}
+            for reshaped, weight in contributions:
+                low, high = ranges[reshaped]
+                for idx in range(low, high):
+                    row[idx] = row.get(idx, 0.0) + weight
+            for idx in sorted(row):
+                indices.append(idx)
+                weights.append(row[idx])
+            starts.append(len(indices))
+
+        # the number of entries grows with the width and the reshape factor
+        # so it may exceed 16 bits
+        self._starts = array("I", starts)
+        self._indices = array("H", indices)
+        self._weights = array("f", weights)
+
+    def apply(self, spectrum, output, floor=None):
+        """
+        maps the spectrum onto the columns of the output
+        bins of the spectrum which do not exceed the floor are ignored
+        """
+        spectrum.project(self._starts, self._indices, self._weights, output, floor)
@@ -49,6 +49,13 @@ class AudioManager:
         )
         self._info.notify()
 
+    def update(self):
+        """
+        analyze the selected audio source if a layer asked for its results
+        (other sources only collect samples)
+        """
+        return self._selected.update()
+
     def add_source(self, source):
         self._sources[source.name] = source
 
@@ -1,6 +1,8 @@
 from fft import FftPlan, bin_stats
 from reshape import reshape
 from buffer import FloatBuffer
+from .features import AudioFeatures
+from .filterbank import Filterbank
 from ..variables.manager import VariableManager
 from ..variables.types import FloatingVariable, IntegerVariable
 from ..variables.responder import VariableResponder
@@ -37,10 +39,28 @@ class AudioSource:
         self._sample_frequency = sample_frequency
         self._sample_length = sample_length
 
-        # create an FloatBuffer that will hold the samples
+        # create an FloatBuffer that will hold the window of samples which
+        # is analyzed
         # (this is a faster object to use to store floating point values)
         self._buffer = FloatBuffer(sample_length)
 
+        # incoming samples are written into a ring buffer at this index so
+        # that the latest window can be analyzed at any time
+        self._ring = FloatBuffer(sample_length)
+        self._write_index = 0
+
+        # the window may be analyzed once this many new samples have been
+        # written (by default windows do not overlap)
+        # the first window may be analyzed once the ring has been filled
+        self._hop = sample_length
+        self._samples_until_analysis = sample_length
+
+        # the analysis only runs when its results have been requested,
+        # either by reading them during the frame or by a subscription which
+        # lasts until it is withdrawn
+        self._requested = False
+        self._subscriptions = 0
+
         # create an AudioSourceFFT for the source
         self._fft = AudioSourceFFT(sample_frequency, self._buffer)
 
@@ -50,10 +70,88 @@ class AudioSource:
         to handle audio data.
 
         Responsibilities of this routine are as follows:
-        - fill the buffer with audio samples
+        - fill the ring buffer with audio samples (see write_samples)
+
+        The samples are analyzed on demand by update().
+        """
+
+    def set_hop(self, hop):
+        """
+        Sets the number of new samples between analyses. A hop shorter than
+        the window makes consecutive windows overlap. The new hop applies
+        after the next analysis.
+        """
+        self._hop = min(max(int(hop), 1), self._sample_length)
+
+    def write_samples(self, data, bytes_per_sample):
+        """
+        Decodes little endian signed integer samples from a bytes-like
+        object into the ring buffer. Trailing bytes of an incomplete sample
+        are ignored.
+        """
+        count = len(data) // bytes_per_sample
+        if count == 0:
+            return
+        self._write_index = self._ring.decode(data, bytes_per_sample, self._write_index)
+        self._samples_until_analysis -= count
+
+    def mark_written(self, count):
+        """
+        Records that count samples were written into the ring buffer
+        directly, starting at the write index.
+        """
+        self._write_index = (self._write_index + count) % self._sample_length
+        self._samples_until_analysis -= count
+
+    def subscribe(self):
+        """
+        Requests the analysis on every update until unsubscribe() is called.
+        This is needed by users which keep the buffers of the results rather
+        than reading them again on every frame.
+        """
+        self._subscriptions += 1
 
-        This coroutine may manipulate the data as needed.
+    def unsubscribe(self):
         """
+        Withdraws a subscription made with subscribe().
+        """
+        if self._subscriptions > 0:
+            self._subscriptions -= 1
+
+    def update(self):
+        """
+        Analyzes the latest window when its results have been requested
+        since the last update (or are subscribed to) and at least a hop of
+        new samples has arrived.
+        This is meant to be called once per frame, so the analysis runs at
+        the frame rate at most no matter how the samples arrive.
+        returns True when the window was analyzed
+        """
+        if not self._requested and self._subscriptions == 0:
+            return False
+        self._requested = False
+        if self._samples_until_analysis > 0:
+            return False
+        self._samples_until_analysis = self._hop
+        self.analyze()
+        return True
+
+    def load_window(self):
+        """
+        Copies the latest window of samples from the ring buffer in order.
+        """
+        self._buffer.copy(self._ring, self._write_index)
+
+    def analyze(self):
+        """
+        Analyzes the latest window of samples.
+        """
+        self.load_window()
+        self._fft.compute()
+
+    @property
+    def hop(self):
+        return self._hop
 
     @property
     def name(self):
@@ -61,6 +159,12 @@ class AudioSource:
 
     @property
     def fft(self):
+        """
+        The fft of the latest window. Reading it requests the analysis on
+        the next update only, so it must be read again on every frame
+        unless the source is subscribed to.
+        """
+        self._requested = True
         return self._fft
 
 
@@ -75,10 +179,24 @@ class ManagedAudioSource(AudioSource):
             self._reshaped_fft_bins_available
         )
         self._reshaped_fft_output = self._reshaped_fft_output_buffer.reference()
+        self._reshaped_window = (0, self._reshaped_fft_bins_available)
+
+        # the reshaped output is only computed when it is used
+        self._reshape_requested = False
+        self._reshape_subscriptions = 0
+
+        # the spectrum may also be mapped directly onto a number of columns
+        # by filterbanks which are rebuilt only when the mapping changes
+        # (the column buffers are kept so that references to them stay valid)
+        self._filterbanks = {}
+        self._columns = {}
 
         self._floor = None
         self._factor = None
 
+        # features shared by every layer are computed after the fft
+        self._features = AudioFeatures(self._sample_frequency, self._sample_length)
+
         # create root path
         self._root_path = f"{path}/{self._name}"
 
@@ -133,9 +251,22 @@ class ManagedAudioSource(AudioSource):
                 responders=[self._private_variable_responder],
             )
         )
+        self._private_variable_manager.declare_variable(
+            FloatingVariable(
+                "fft_overlap",
+                0.5,
+                default_range=(0.0, 0.75),
+                allowed_range=(0.0, 0.875),
+                responders=[self._private_variable_responder],
+            )
+        )
         self._private_variable_manager.initialize_variables()
 
     def _handle_private_variable_change(self, variable):
+        if variable.name == "fft_overlap":
+            # consecutive windows share this fraction of their samples
+            self.set_hop(self._sample_length * (1.0 - variable.value))
+
         if variable.name in ("fft_reshape_factor", "fft_min_bin", "fft_max_bin"):
             """
             handle changes in variables which affect the fft output buffer reference
@@ -169,13 +300,46 @@ class ManagedAudioSource(AudioSource):
             self._reshaped_fft_output = self._reshaped_fft_output_buffer.reference(
                 window=(window_min, window_max)
             )
+            self._reshaped_window = (window_min, window_max)
+
+            # the column mappings depend on the same variables
+            for width in self._filterbanks:
+                self._filterbanks[width] = self._make_filterbank(width)
+
+    def _make_filterbank(self, width):
+        reshape_factor = self.private_variable_manager.variables[
+            "fft_reshape_factor"
+        ].value
+        return Filterbank(
+            len(self._fft.output), reshape_factor, self._reshaped_window, width
+        )
 
     def apply_volume(self):
         # scale the audio data by the volume
         volume = self.private_variable_manager.variables["volume"].value
         self._buffer.scale(volume)
 
+    def analyze(self):
+        self.load_window()
+        self.apply_volume()
+        self._fft.compute()
+        self.fft_postprocess()
+        self._project_columns()
+
+        # the ring holds the same samples as the (now windowed) buffer
+        self._features.update(
+            self._ring,
+            self._fft.output,
+            self.private_variable_manager.variables["volume"].value,
+        )
+
     def fft_postprocess(self):
+        # reshaping is skipped unless the reshaped output was used since the
+        # last analysis (columns are cheaper to get from the filterbanks)
+        if not self._reshape_requested and self._reshape_subscriptions == 0:
+            return
+        self._reshape_requested = False
+
         reshape_factor = self.private_variable_manager.variables[
             "fft_reshape_factor"
         ].value
@@ -187,6 +351,50 @@ class ManagedAudioSource(AudioSource):
             reshape_config, self._fft._output_buffer, self._reshaped_fft_output_buffer
         )
 
+    def _project_columns(self):
+        reshape_floor = self.private_variable_manager.variables[
+            "fft_reshape_floor"
+        ].value
+        for width, filterbank in self._filterbanks.items():
+            filterbank.apply(self._fft.output, self._columns[width], reshape_floor)
+
+    def subscribe(self, reshaped=False):
+        """
+        Requests the analysis on every update until unsubscribe() is called
+        with the same arguments. The reshaped fft output is also kept up to
+        date when reshaped is True.
+        """
+        super().subscribe()
+        if reshaped:
+            self._reshape_subscriptions += 1
+
+    def unsubscribe(self, reshaped=False):
+        super().unsubscribe()
+        if reshaped and self._reshape_subscriptions > 0:
+            self._reshape_subscriptions -= 1
+
+    def columns(self, width):
+        """
+        The spectrum mapped onto the given number of columns, e.g. the width
+        of a display. This matches aligning the reshaped fft output to the
+        columns, but it is computed with a filterbank in a single step.
+        Calling this requests the analysis on the next update only, so the
+        returned buffer only stays current when this is called on every
+        frame or the source is subscribed to.
+        """
+        self._requested = True
+        columns = self._columns.get(width)
+        if columns is None:
+            columns = FloatBuffer(width)
+            self._filterbanks[width] = self._make_filterbank(width)
+            self._columns[width] = columns
+            self._filterbanks[width].apply(
+                self._fft.output,
+                columns,
+                self.private_variable_manager.variables["fft_reshape_floor"].value,
+            )
+        return columns
+
     @property
     def variable_manager(self):
         return self._variable_manager
@@ -195,6 +403,20 @@ class ManagedAudioSource(AudioSource):
     def private_variable_manager(self):
         return self._private_variable_manager
 
+    @property
+    def features(self):
+        """
+        The features of the latest analysis, requested like the fft.
+        """
+        self._requested = True
+        return self._features
+
     @property
     def reshaped_fft_output(self):
+        """
+        The reshaped fft of the latest analysis, requested like the fft
+        (subscribe with reshaped=True to keep it current).
+        """
+        self._requested = True
+        self._reshape_requested = True
         return self._reshaped_fft_output
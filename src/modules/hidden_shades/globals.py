@@ -39,6 +39,14 @@ class GlobalsManager:
         self._variable_manager.declare_variable(
             ColorSequenceVariable("palette", DEFAULT_PALETTE)
         )
+        self._variable_manager.declare_variable(
+            FloatingVariable(
+                "framerate",
+                30.0,
+                default_range=(1.0, 60.0),
+                allowed_range=(1.0, 240.0),
+            )
+        )
         self._variable_manager.initialize_variables()
 
     @property
@@ -4,7 +4,8 @@ from .variables.manager import VariableManager
 from .variables.types import OptionVariable, FloatingVariable, ColorSequenceVariable
 from .variables.responder import VariableResponder
 from hidden_shades import globals
-from pathutils import rmdirr
+from persistence import store_for
+from profiling import StageProfiler
 
 
 class Layer:
@@ -14,6 +15,18 @@ class Layer:
     DEFAULT_BLENDING_MODE = "normal"
     DEFAULT_COMPOSITION_MODE = "alpha_source_over"
 
+    # stages of rendering a layer which are individually profiled
+    PROFILE_GENERATOR = 0
+    PROFILE_SCALE = 1
+    PROFILE_COMPOSE = 2
+    PROFILE_STAGES = ("generator", "scale", "compose")
+    PROFILE_HISTORY_LENGTH = 64
+
+    # layers are pending until their frame generator is initialized
+    STATE_PENDING = "pending"
+    STATE_READY = "ready"
+    STATE_FAILED = "failed"
+
     def __init__(self, id, path, interface, init_info={}, post_init_hook=None):
         self.id = id
 
@@ -23,13 +36,37 @@ class Layer:
         self._info_path = f"{self._root_path}/info"
 
         # a pysicgl interface will be provided
+        # (it may be shared with other layers, in which case a private
+        # canvas can be allocated for layers which need one)
         self.canvas = interface
+        self._shared_canvas = interface
+        self._private_canvas = None
+
+        # a private canvas may keep its contents between frames
+        self._clear_canvas = True
 
         # the shard related items are left uninitialized
         # it is possible to set these in the post-init hook
         self._shard = None
         self._frame_generator_obj = None
         self._active = False
+        self._state = Layer.STATE_PENDING
+
+        # the position of the layer in its stack
+        self._index = None
+
+        # static layers declare that their output depends only on their
+        # variables and palette so the rendered pixels may be reused until
+        # one of those changes
+        self._static = False
+        self._dirty = True
+        self._cached_palette = None
+        self._static_memory = None
+
+        # rolling timing information about rendering this layer
+        self._profiler = StageProfiler(
+            Layer.PROFILE_STAGES, Layer.PROFILE_HISTORY_LENGTH
+        )
 
         # static info does not change
         self._static_info = {
@@ -37,11 +74,13 @@ class Layer:
         }
 
         # variables which may be dynamically registered for external control
-        self._variable_manager = VariableManager(f"{self._root_path}/vars")
+        self._variable_manager = VariableManager(
+            f"{self._root_path}/vars", lambda variable: self.invalidate()
+        )
 
         # declare private variables
         self._private_variable_manager = VariableManager(
-            f"{self._root_path}/private_vars"
+            f"{self._root_path}/private_vars", lambda variable: self.invalidate()
         )
         self._private_variable_responder = VariableResponder(
             lambda variable: self._handle_private_variable_change(variable)
@@ -76,19 +115,26 @@ class Layer:
         )
         self._private_variable_manager.initialize_variables()
 
+        # the info values which were last applied to the layer
+        self._applied_info = {}
+
         # mutable info recorded in a cache
         # (this must be done after default values are set because it
         # will automatically enable the module if possible)
+        # the info is written right away since a layer can not be loaded
+        # without it
         initial_info = {
             "shard_uuid": None,
-            "index": None,
             "active": True,
             "use_local_palette": False,
+            "private_canvas": False,
+            "clear_canvas": True,
         }
         self._info = Cache(
             f"{self._root_path}/info",
             dict(**initial_info, **init_info),
             lambda key, value: self._handle_info_change(key, value),
+            sync=True,
         )
 
         # allow for post-init
@@ -104,11 +150,29 @@ class Layer:
             self._integer_blending_mode = Layer.BLENDING_MODES[key]
 
     def _handle_info_change(self, key, value):
+        # merging info notifies every key, so only values which differ from
+        # those applied before may affect the canvas
+        if key in self._applied_info and self._applied_info[key] == value:
+            return None
+        corrected = self._apply_info(key, value)
+        self._applied_info[key] = value if corrected is None else corrected
+        return corrected
+
+    def _apply_info(self, key, value):
         self.reset_canvas()
+        self.invalidate()
         if key == "active":
             active = bool(value)
             self._active = active
             return active
+        if key == "private_canvas":
+            private = bool(value)
+            self.set_private_canvas(private)
+            return private
+        if key == "clear_canvas":
+            clear = bool(value)
+            self._clear_canvas = clear
+            return clear
         if key == "palette":
             if value is None:
                 self._palette = None
@@ -121,11 +185,18 @@ class Layer:
         """
         Removes the layer information from storage
         """
-        rmdirr(self._root_path)
+        store_for(self._root_path).remove(self._root_path)
 
     def initialize_frame_generator(self):
         self._frame_generator_obj = self._shard.frames(self)
         next(self._frame_generator_obj)
+        self._state = Layer.STATE_READY
+
+    def set_failed(self):
+        """
+        Marks a pending layer whose shard could not be initialized.
+        """
+        self._state = Layer.STATE_FAILED
 
     def set_shard(self, shard):
         self._shard = shard
@@ -133,18 +204,75 @@ class Layer:
     def run(self):
         """
         Gets the next frame from the frame generator object, only if the layer is ready and active
+
+        This begins a new profiling period for the layer. The compositor
+        is expected to mark the compose stage and end the period.
         """
         if self._active:
+            profiler = self._profiler
+            profiler.begin()
+
+            # static layers with valid cached output do not need to be rendered
+            if self.cached:
+                return
+
             next(self._frame_generator_obj)
+            profiler.mark(Layer.PROFILE_GENERATOR)
             self.canvas.interface_scale(
                 self._private_variable_manager.variables["brightness"].value
             )
+            profiler.mark(Layer.PROFILE_SCALE)
+
+            # keep a copy of the output of static layers
+            # (the output remains in a private canvas between frames)
+            if self._static:
+                if self.canvas is self._shared_canvas:
+                    self._static_memory[:] = self.canvas.memory
+                self._cached_palette = self.palette
+                self._dirty = False
+
+    def set_private_canvas(self, private):
+        """
+        Selects whether the layer renders into its own canvas rather than
+        the interface provided at construction. The private canvas is
+        allocated on first use and kept for the lifetime of the layer.
+        """
+        if private:
+            if self._private_canvas is None:
+                screen = self._shared_canvas.screen
+                self._private_canvas = pysicgl.Interface(
+                    screen, pysicgl.allocate_pixel_memory(screen.pixels)
+                )
+            self.canvas = self._private_canvas
+        else:
+            self.canvas = self._shared_canvas
+        self.invalidate()
+
+    def set_static(self, static):
+        """
+        Declares whether the output of the layer depends only on its
+        variables and palette. The output of a static layer is rendered
+        once and reused until it is invalidated.
+        """
+        self._static = bool(static)
+        if self._static and self._static_memory is None:
+            self._static_memory = pysicgl.allocate_pixel_memory(
+                self.canvas.screen.pixels
+            )
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        Forces a static layer to be rendered again on the next frame.
+        """
+        self._dirty = True
 
     def reset_canvas(self):
         self.canvas.interface_fill(0x000000)
 
     def set_index(self, idx):
-        self._info.set("index", idx)
+        # the index is derived from the order of the stack, which persists it
+        self._index = idx
 
     def set_active(self, active):
         self._info.set("active", bool(active))
@@ -155,9 +283,79 @@ class Layer:
     def use_local_palette(self, use_local):
         self._info.set("use_local_palette", bool(use_local))
 
+    def snapshot(self):
+        """
+        Returns the configuration and variable values of the layer in the
+        form accepted when adding layers to a stack.
+        """
+        config = self.info
+        del config["id"]
+        del config["index"]
+        return {
+            "config": config,
+            "variables": self._variable_manager.serialized_values(),
+            "standardVariables": self._private_variable_manager.serialized_values(),
+        }
+
     @property
     def info(self):
-        return dict(**self._info.cache, **self._static_info)
+        info = dict(self._info.cache)
+        info.update(self._static_info)
+        info["index"] = self._index
+        return info
+
+    @property
+    def index(self):
+        return self._index
+
+    @property
+    def state(self):
+        return self._state
+
+    @property
+    def profiler(self):
+        return self._profiler
+
+    @property
+    def profile(self):
+        summary = self._profiler.summary()
+        profile = summary["stages"]
+        profile["total"] = summary["total"]
+        return profile
+
+    @property
+    def private_canvas(self):
+        return self.canvas is not self._shared_canvas
+
+    @property
+    def clears_canvas(self):
+        """
+        True when the canvas should be cleared before rendering the layer.
+        A shared canvas is always cleared, while a private canvas may keep
+        the previous output of the layer to allow for persistence effects.
+        """
+        return self._clear_canvas or self.canvas is self._shared_canvas
+
+    @property
+    def static(self):
+        return self._static
+
+    @property
+    def cached(self):
+        """
+        True when the layer is static and its cached output is still valid
+        """
+        return self._static and not self._dirty and self._cached_palette is self.palette
+
+    @property
+    def memory(self):
+        """
+        The pixel memory holding the latest output of this layer.
+        Compositors should read from here rather than the canvas memory.
+        """
+        if self._static and self.canvas is self._shared_canvas:
+            return self._static_memory
+        return self.canvas.memory
 
     @property
     def variable_manager(self):
@@ -11,6 +11,10 @@ class TimeWarp:
         self._local += self._frequency * delta
         self._prev = now
 
+    def set_reference(self, reference):
+        self._reference = reference
+        self._prev = self._reference()
+
     def set_frequency(self, freq):
         self._frequency = float(freq)
 
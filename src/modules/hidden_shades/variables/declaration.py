@@ -96,7 +96,15 @@ class VariableDeclaration:
 
     @value.setter
     def value(self, val):
+        self.set_value(val)
+
+    def set_value(self, val, notify=True):
+        """
+        sets the value, optionally without notifying responders so that
+        several values may be changed before a batched notification
+        """
         if not self.validate(val):
             raise ValueError
         self._value = val
-        self.notify()
+        if notify:
+            self.notify()
@@ -1,23 +1,38 @@
-from pathutils import ensure_dirs
+from persistence import store_for
 from .responder import VariableResponder
 
 
 class VariableManager(VariableResponder):
-    def __init__(self, path):
+    def __init__(self, path, on_change=None):
         super().__init__(lambda variable: self._handle_variable_change(variable))
         self._path = path
         self._variables = {}
+        self._on_change = on_change
+        self._notifying = None
+        self._store = store_for(path)
 
-        # ensure filesystem storage exists
-        ensure_dirs(self._path)
+        # ensure storage exists
+        self._store.prepare(self._path)
 
     def _handle_variable_change(self, variable):
-        self._store_variable(variable)
+        if variable is not self._notifying:
+            self._store_variable(variable)
+        if self._on_change is not None:
+            self._on_change(variable)
+
+    def set_change_handler(self, on_change):
+        """
+        Used to set a handler which is called after any declared variable changes.
+        """
+        self._on_change = on_change
 
     def _store_variable(self, variable):
-        serialized = variable.serialize(variable.value)
-        with open(f"{self._path}/{variable.name}", "w") as f:
-            f.write(serialized)
+        # the value is serialized when the store is flushed so that rapid
+        # changes only cost one write
+        self._store.save(
+            f"{self._path}/{variable.name}",
+            lambda: variable.serialize(variable.value),
+        )
 
     def declare_variable(self, variable):
         """
@@ -32,25 +47,48 @@ class VariableManager(VariableResponder):
     def initialize_variables(self):
         """
         This method should be called once all variables have been declared.
-        It is used to load the initial values, if any, from the filesystem and notify
+        It is used to load the initial values, if any, from storage and notify
         responders as needed.
+
+        Only values which differ from storage are written back.
         """
+        # load all the stored values before changing any variables
+        stored = dict(
+            (name, self._store.load(f"{self._path}/{name}"))
+            for name in self._variables.keys()
+        )
+
         for name, variable in self._variables.items():
-            # try to read the serialized value from memory allowing for it not to exist
-            serialized = None
-            try:
-                with open(f"{self._path}/{variable.name}", "r") as f:
-                    serialized = str(f.read())
-            except OSError:
-                pass
-
-            # if a serialized value was found use it to set the value of the variable
+            # use the stored value when it is valid, otherwise keep the
+            # current value and replace the stored one
+            serialized = stored[name]
             if serialized is not None:
-                variable.value = variable.deserialize(serialized)
+                try:
+                    variable.set_value(variable.deserialize(serialized), False)
+                except (ValueError, TypeError):
+                    serialized = None
 
-            # finally store the current value and notify any responders
-            self._store_variable(variable)
-            variable.notify()
+            if serialized != variable.serialize(variable.value):
+                self._store_variable(variable)
+
+        # notify responders once all values are in place
+        # (each value is already stored so its own notification does not
+        # store it again)
+        try:
+            for variable in self._variables.values():
+                self._notifying = variable
+                variable.notify()
+        finally:
+            self._notifying = None
+
+    def serialized_values(self):
+        """
+        returns the serialized value of each variable by name
+        """
+        return dict(
+            (name, variable.serialize(variable.value))
+            for name, variable in self._variables.items()
+        )
 
     @property
     def variables(self):
@@ -0,0 +1,328 @@
+import os
+import json
+from pathutils import ensure_dirs, ensure_parent_dirs, rmdirr
+
+
+def write_atomic(path, content):
+    """
+    Write content to a file so that the file holds either its previous or
+    its new content even if interrupted. The content is written to a
+    temporary file which then replaces the original.
+    """
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(content)
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        # some filesystems will not rename over an existing file
+        os.remove(path)
+        os.rename(tmp, path)
+
+
+class WriteBehind:
+    """
+    Coalesces writes to files in memory and flushes them later.
+
+    Writers schedule a path along with a function that produces the
+    content for it. Scheduling the same path again before a flush replaces
+    the pending write so that rapid changes only cost one write.
+
+    Stores which manage their own writes may be registered to be flushed
+    at the same time.
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._stores = []
+
+    def schedule(self, path, serialize):
+        self._pending[path] = serialize
+
+    def register(self, store):
+        self._stores.append(store)
+
+    def discard(self, prefix):
+        """
+        drop pending writes for paths beneath the given prefix
+        (used before removing the storage they belong to)
+        """
+        for path in list(self._pending.keys()):
+            if path == prefix or path.startswith(f"{prefix}/"):
+                del self._pending[path]
+
+    def flush(self):
+        pending = self._pending
+        self._pending = {}
+        for path, serialize in pending.items():
+            try:
+                write_atomic(path, serialize())
+            except OSError as e:
+                print(f"ERROR: failed to write {path}: {e}")
+
+        for store in self._stores:
+            try:
+                store.flush()
+            except OSError as e:
+                print(f"ERROR: failed to flush {store.root}: {e}")
+
+    async def run(self, period_ms=2000):
+        import uasyncio as asyncio
+
+        while True:
+            await asyncio.sleep_ms(period_ms)
+            self.flush()
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+
+# the write-behind instance shared by all persistent storage
+writer = WriteBehind()
+
+
+class FileStore:
+    """
+    Stores each value in its own file at its path.
+    """
+
+    root = ""
+
+    def load(self, path):
+        """
+        returns the stored string for the path or None if there is none
+        """
+        try:
+            with open(path, "r") as f:
+                return str(f.read())
+        except OSError:
+            return None
+
+    def save(self, path, serialize, sync=False):
+        """
+        schedule a value to be written, or write it right away when sync is
+        set (for records which other stored values depend upon)
+        """
+        if sync:
+            writer.discard(path)
+            write_atomic(path, serialize())
+        else:
+            writer.schedule(path, serialize)
+
+    def prepare(self, path):
+        """
+        make sure that values may be saved beneath the given path
+        """
+        ensure_dirs(path)
+
+    def prepare_parent(self, path):
+        """
+        make sure that a value may be saved at the given path
+        """
+        ensure_parent_dirs(path)
+
+    def exists(self, path):
+        try:
+            os.stat(path)
+            return True
+        except OSError:
+            return False
+
+    def children(self, path):
+        return os.listdir(path)
+
+    def remove(self, path):
+        writer.discard(path)
+        rmdirr(path)
+
+
+class LogStore:
+    """
+    Stores all values beneath a root path in a single append-only log.
+
+    Each line of the log is a json array of a path (relative to the root)
+    and its value, with null marking a removed value. Later lines replace
+    earlier ones, so loading costs one sequential read. Changes are
+    appended when the write-behind writer flushes and the log is rewritten
+    with only the live values once it grows too long.
+
+    When no log exists the values are migrated from the one-file-per-value
+    tree under the root, which is left in place.
+    """
+
+    LOG_NAME = "state"
+
+    def __init__(self, root, compaction_ratio=2, compaction_minimum=64):
+        self.root = root
+        self._log_path = f"{root}/{LogStore.LOG_NAME}"
+        self._compaction_ratio = compaction_ratio
+        self._compaction_minimum = compaction_minimum
+
+        self._entries = {}
+        self._dirty = {}
+        self._records = 0
+
+        ensure_dirs(root)
+        try:
+            intact = self._read_log()
+        except OSError:
+            self._migrate()
+        else:
+            # a torn record would swallow the next appended record, so the
+            # live values are rewritten before anything is appended
+            if not intact:
+                print(f"discarding torn records in {self._log_path}")
+                self.compact()
+        writer.register(self)
+
+    def _relative(self, path):
+        return path[len(self.root) + 1 :]
+
+    def _absolute(self, key):
+        return f"{self.root}/{key}"
+
+    def _read_log(self):
+        """
+        returns False when the log ends in a torn record
+        """
+        with open(self._log_path, "r") as f:
+            while True:
+                line = f.readline()
+                if not line:
+                    return True
+                if not line.endswith("\n"):
+                    # the last record was interrupted before it was complete
+                    return False
+                try:
+                    key, value = json.loads(line)
+                except ValueError:
+                    # nothing after a torn record can be trusted
+                    return False
+                path = self._absolute(key)
+                if value is None:
+                    self._entries.pop(path, None)
+                else:
+                    self._entries[path] = value
+                self._records += 1
+
+    def _migrate(self):
+        self._walk(self.root)
+        self.compact()
+        print(f"migrated {len(self._entries)} values into {self._log_path}")
+
+    def _walk(self, dir):
+        for info in os.ilistdir(dir):
+            path = f"{dir}/{info[0]}"
+            if info[1] == 0x4000:
+                self._walk(path)
+            elif info[1] == 0x8000:
+                if path == self._log_path or path.endswith(".tmp"):
+                    continue
+                with open(path, "r") as f:
+                    self._entries[path] = str(f.read())
+
+    def _contains(self, path, prefix):
+        return path == prefix or path.startswith(f"{prefix}/")
+
+    def _live_paths(self):
+        for path, serialize in self._dirty.items():
+            if serialize is not None:
+                yield path
+        for path in self._entries.keys():
+            if path not in self._dirty:
+                yield path
+
+    def load(self, path):
+        if path in self._dirty:
+            serialize = self._dirty[path]
+            return serialize() if serialize is not None else None
+        return self._entries.get(path)
+
+    def save(self, path, serialize, sync=False):
+        self._dirty[path] = serialize
+        if sync:
+            self.flush()
+
+    def prepare(self, path):
+        pass
+
+    def prepare_parent(self, path):
+        pass
+
+    def exists(self, path):
+        for live in self._live_paths():
+            if self._contains(live, path):
+                return True
+        return False
+
+    def children(self, path):
+        offset = len(path) + 1
+        names = []
+        for live in self._live_paths():
+            if live.startswith(f"{path}/"):
+                name = live[offset:].split("/")[0]
+                if name not in names:
+                    names.append(name)
+        return names
+
+    def remove(self, path):
+        for live in list(self._live_paths()):
+            if self._contains(live, path):
+                self._dirty[live] = None
+        self.flush()
+
+    def flush(self):
+        if len(self._dirty) == 0:
+            return
+
+        dirty = self._dirty
+        self._dirty = {}
+        lines = []
+        for path, serialize in dirty.items():
+            if serialize is None:
+                self._entries.pop(path, None)
+                value = None
+            else:
+                value = serialize()
+                self._entries[path] = value
+            lines.append(json.dumps([self._relative(path), value]))
+
+        # rewrite the log once it holds too many stale records
+        self._records += len(lines)
+        limit = self._compaction_ratio * len(self._entries)
+        if self._records > max(limit, self._compaction_minimum):
+            self.compact()
+        else:
+            with open(self._log_path, "a") as f:
+                f.write("".join(f"{line}\n" for line in lines))
+
+    def compact(self):
+        """
+        rewrite the log with only the live values
+        """
+        lines = list(
+            json.dumps([self._relative(path), value])
+            for path, value in self._entries.items()
+        )
+        write_atomic(self._log_path, "".join(f"{line}\n" for line in lines))
+        self._records = len(lines)
+
+
+# stores which take over the paths beneath their root
+_mounted = []
+_default_store = FileStore()
+
+
+def mount(store):
+    _mounted.append(store)
+
+
+def store_for(path):
+    """
+    returns the store responsible for the given path
+    """
+    for store in _mounted:
+        if path == store.root or path.startswith(f"{store.root}/"):
+            return store
+    return _default_store
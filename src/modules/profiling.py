@@ -1,4 +1,5 @@
 import time
+from array import array
 
 
 class ProfileTimer:
@@ -17,6 +18,135 @@ class ProfileTimer:
         return self._delta / 1000
 
 
+def percentile(ordered, p):
+    """
+    nearest-rank percentile of an already sorted sequence
+    """
+    if len(ordered) == 0:
+        return None
+    rank = int(p * len(ordered) / 100 + 0.5)
+    if rank < 1:
+        rank = 1
+    return ordered[rank - 1]
+
+
+class ProfileHistory:
+    """
+    Fixed-size ring buffer of durations in microseconds.
+    Recording a sample does not allocate, so it is safe to use in the
+    render loop. Statistics are only computed on request.
+    """
+
+    def __init__(self, length=64):
+        self._length = length
+        self._samples = array("l", (0 for _ in range(length)))
+        self._idx = 0
+        self._count = 0
+
+    def record(self, value):
+        self._samples[self._idx] = value
+        self._idx += 1
+        if self._idx >= self._length:
+            self._idx = 0
+        if self._count < self._length:
+            self._count += 1
+
+    def clear(self):
+        self._idx = 0
+        self._count = 0
+
+    def values(self):
+        if self._count < self._length:
+            return list(self._samples[: self._count])
+        return list(self._samples[self._idx :]) + list(self._samples[: self._idx])
+
+    def summary(self):
+        ordered = sorted(self.values())
+        count = len(ordered)
+        if count == 0:
+            return {"count": 0}
+        total = sum(ordered)
+        return {
+            "count": count,
+            "total": total,
+            "min": ordered[0],
+            "mean": total / count,
+            "max": ordered[-1],
+            "p50": percentile(ordered, 50),
+            "p95": percentile(ordered, 95),
+            "p99": percentile(ordered, 99),
+        }
+
+    def __len__(self):
+        return self._count
+
+
+class StageProfiler:
+    """
+    Accumulates the time spent in named stages of a repeated process
+    (e.g. a render frame) and records the per-iteration totals into
+    ring buffers.
+
+    Stages are referred to by their index in the sequence given at
+    construction so that marking a stage stays cheap.
+    """
+
+    def __init__(self, stages, length=64):
+        self._stages = tuple(stages)
+        self._accumulated = array("l", (0 for _ in self._stages))
+        self._histories = tuple(ProfileHistory(length) for _ in self._stages)
+        self._total = ProfileHistory(length)
+        self._start = 0
+        self._t = 0
+
+    def begin(self):
+        for idx in range(len(self._accumulated)):
+            self._accumulated[idx] = 0
+        self._start = time.ticks_us()
+        self._t = self._start
+
+    def skip(self):
+        """
+        restart the stage clock without attributing the elapsed time
+        """
+        self._t = time.ticks_us()
+
+    def mark(self, stage):
+        """
+        attribute the time since the previous mark to the given stage index
+        """
+        now = time.ticks_us()
+        self._accumulated[stage] += time.ticks_diff(now, self._t)
+        self._t = now
+
+    def end(self):
+        for idx in range(len(self._accumulated)):
+            self._histories[idx].record(self._accumulated[idx])
+        self._total.record(time.ticks_diff(self._t, self._start))
+
+    def clear(self):
+        for history in self._histories:
+            history.clear()
+        self._total.clear()
+
+    def summary(self):
+        return {
+            "stages": dict(
+                (name, self._histories[idx].summary())
+                for idx, name in enumerate(self._stages)
+            ),
+            "total": self._total.summary(),
+        }
+
+    @property
+    def stages(self):
+        return self._stages
+
+    @property
+    def period_us(self):
+        return time.ticks_diff(self._t, self._start)
+
+
 # @timed
 def timed(f, *args, **kwargs):
     t = ProfileTimer()
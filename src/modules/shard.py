@@ -1,24 +1,255 @@
+import os
+import sys
+import hashlib
+import binascii
+from cache import Cache
+
+
+def mpy_cross_compiler(executable):
+    """
+    returns a compiler function which uses the given mpy-cross executable
+    to compile a python source file into a .mpy file
+    (requires os.system, e.g. on the unix port)
+    """
+
+    def compile(source_path, output_path):
+        return os.system(f'"{executable}" -o "{output_path}" "{source_path}"') == 0
+
+    return compile
+
+
+def bytecode_version():
+    """
+    the version (and architecture flags) of the bytecode which this
+    firmware imports, or 0 when it imports no bytecode
+    """
+    return getattr(sys.implementation, "_mpy", 0)
+
+
+def content_hash(source):
+    """
+    the hex encoded sha256 digest of the given source
+    """
+    if isinstance(source, str):
+        source = source.encode()
+    return binascii.hexlify(hashlib.sha256(source).digest()).decode()
+
+
 class ShardManager:
-    def __init__(self, path):
+    """
+    Stores shard source code and imports shards as modules.
+
+    Uploaded shards are stored by the hash of their content and their uuids
+    are recorded as aliases of that hash, so identical shards are stored
+    once. Shards may also be placed by hand in the shard directory, named
+    by their uuid.
+
+    Shards are immutable, so each distinct shard is imported once and the
+    module is shared by every layer that uses it. When a compiler and a
+    cache path are given each shard is compiled into bytecode (named by
+    hash and bytecode version) when it is stored so that importing it later
+    does not require the source to be compiled, which would otherwise stall
+    the render loop. Bytecode which can not be imported is discarded and
+    the shard is imported from source instead.
+    """
+
+    BYTECODE_EXTENSION = "mpy"
+
+    # uploads are read in chunks of this many bytes
+    CHUNK_SIZE = 1024
+
+    def __init__(
+        self, path, store_path, cache_path=None, compiler=None, max_size=1024 * 1024
+    ):
         from pathutils import ensure_dirs
 
         self._path = path
+        self._store_path = store_path
+        self._cache_path = cache_path
+        self._compiler = compiler
+        self._max_size = max_size
 
-        # ensure that the desired path exists
+        # ensure that the desired paths exist
         ensure_dirs(self._path)
+        ensure_dirs(self._store_path)
+        if self._cache_path is not None:
+            ensure_dirs(self._cache_path)
+
+        # uuids of uploaded shards map to the hash of their content
+        # (written right away so that a stored shard is never orphaned)
+        self._aliases = Cache(f"{self._store_path}/aliases", {}, sync=True)
+
+        # hashes of the shards placed by hand are computed on demand
+        self._hashes = {}
+
+        # imported modules by hash
+        self._modules = {}
+
+    def _object_path(self, hash):
+        return f"{self._store_path}/{hash}.py"
+
+    def _bytecode_module(self, hash):
+        return f"{self._cache_path}/{hash}_{bytecode_version():x}"
+
+    def _bytecode_path(self, hash):
+        return f"{self._bytecode_module(hash)}.{ShardManager.BYTECODE_EXTENSION}"
+
+    def _remove_bytecode(self, hash):
+        try:
+            os.remove(self._bytecode_path(hash))
+        except OSError:
+            pass
+
+    def _exists(self, path):
+        try:
+            os.stat(path)
+            return True
+        except OSError:
+            return False
+
+    def source_path(self, uuid):
+        hash = self._aliases.cache.get(uuid)
+        if hash is not None:
+            return self._object_path(hash)
+        return f"{self._path}/{uuid}.py"
+
+    def shard_hash(self, uuid):
+        """
+        the content hash of the shard with the given uuid
+        """
+        hash = self._aliases.cache.get(uuid)
+        if hash is not None:
+            return hash
+
+        hash = self._hashes.get(uuid)
+        if hash is None:
+            with open(self.source_path(uuid), "rb") as f:
+                hash = content_hash(f.read())
+            self._hashes[uuid] = hash
+        return hash
+
+    def shard_size(self, uuid):
+        return os.stat(self.source_path(uuid))[6]
+
+    @property
+    def max_size(self):
+        return self._max_size
 
     @property
     def shards(self):
-        import os
+        """
+        the uuids of all available shards
+        """
+        uuids = list(self._aliases.cache.keys())
+        for name in os.listdir(f"{self._path}"):
+            if name.endswith(".py"):
+                uuid = name[:-3]
+                if uuid not in uuids:
+                    uuids.append(uuid)
+        return uuids
+
+    def has_shard(self, uuid):
+        return self._exists(self.source_path(uuid))
+
+    async def receive_shard(self, uuid, stream, length, expected_hash=None):
+        """
+        store a shard of the given length read from an asyncio stream
 
-        available = os.listdir(f"{self._path}")
-        return available
+        The content is written to a temporary file in chunks while its hash
+        is computed, so the size of a shard is not limited by the heap. It
+        is only moved into place once it is complete and matches the
+        expected hash (when given), so an interrupted upload can never be
+        imported.
 
-    def store_shard(self, uuid, source):
-        # shards are uniquely identified by their uuid
-        with open(f"{self._path}/{uuid}.py", "w") as f:
-            f.write(source)
+        raises ValueError when the shard is too large or does not match the
+        expected hash and OSError when the stream ends early
+        """
+        if self.has_shard(uuid):
+            return
+        if length > self._max_size:
+            raise ValueError(f"shard of {length} bytes exceeds {self._max_size}")
+
+        tmp = f"{self._store_path}/{uuid}.tmp"
+        try:
+            hasher = hashlib.sha256()
+            remaining = length
+            with open(tmp, "wb") as f:
+                while remaining > 0:
+                    chunk = await stream.read(min(ShardManager.CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise OSError("shard upload ended early")
+                    hasher.update(chunk)
+                    f.write(chunk)
+                    remaining -= len(chunk)
+
+            hash = binascii.hexlify(hasher.digest()).decode()
+            if expected_hash is not None and expected_hash.lower() != hash:
+                raise ValueError(f"shard hash {hash} does not match {expected_hash}")
+
+            # identical content is only stored once
+            path = self._object_path(hash)
+            if not self._exists(path):
+                os.rename(tmp, path)
+        finally:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+        self._add_alias(uuid, hash)
+
+    def _add_alias(self, uuid, hash):
+        self._aliases.set(uuid, hash)
+        self.compile_shard(uuid)
+
+    def compile_shard(self, uuid):
+        """
+        make sure that the cached bytecode for a shard exists
+        returns True when bytecode is available
+        """
+        if self._compiler is None or self._cache_path is None:
+            return False
+
+        # bytecode is named by the content hash and the bytecode version, so
+        # it is never stale
+        hash = self.shard_hash(uuid)
+        bytecode_path = self._bytecode_path(hash)
+        if self._exists(bytecode_path):
+            return True
+
+        # the bytecode is compiled into a temporary file so that an
+        # interrupted compilation does not leave incomplete bytecode behind
+        tmp = f"{bytecode_path}.tmp"
+        if self._compiler(self.source_path(uuid), tmp):
+            try:
+                os.rename(tmp, bytecode_path)
+                return True
+            except OSError:
+                pass
+
+        print(f"failed to compile shard {uuid}, it will be imported from source")
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return False
 
     def get_shard_module(self, uuid):
-        module = __import__(f"{self._path}/{uuid}")
+        hash = self.shard_hash(uuid)
+        module = self._modules.get(hash)
+        if module is not None:
+            return module
+
+        # prefer the cached bytecode (shards stored before the cache was
+        # enabled are compiled on first use)
+        module = None
+        if self.compile_shard(uuid):
+            try:
+                module = __import__(self._bytecode_module(hash))
+            except (ImportError, ValueError) as e:
+                print(f"discarding bytecode of shard {uuid} ({e})")
+                self._remove_bytecode(hash)
+        if module is None:
+            module = __import__(self.source_path(uuid)[:-3])
+        self._modules[hash] = module
         return module
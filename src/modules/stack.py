@@ -1,8 +1,15 @@
-import os
-from pathutils import rmdirr, ensure_dirs
+import json
+from collections import OrderedDict
+from cache import Cache
+from persistence import store_for
 
 
 class Stack:
+    SNAPSHOT_VERSION = 1
+
+    # the number of failed layers which are remembered
+    MAX_FAILURES = 16
+
     @staticmethod
     def layer_id_generator(self):
         """
@@ -11,36 +18,113 @@ class Stack:
         """
         id = 0
         while True:
-            try:
-                os.stat(self._layer_path_by_id(id))
+            if self._store.exists(self._layer_path_by_id(id)):
                 id += 1
-            except:
+            else:
                 yield id
 
-    def __init__(self, path_prefix, id, layer_initializer):
+    def __init__(self, path_prefix, id, layer_initializer, lazy=False):
         self._id = id
         self._path = f"{path_prefix}{id}"
         self._layers_path = f"{self._path}/layers"
         self._layer_id_generator = Stack.layer_id_generator(self)
+        self._layer_initializer = layer_initializer
+        self._store = store_for(self._path)
 
-        # ensure that a directory exists for layers
-        ensure_dirs(self._layers_path)
+        # ensure that storage exists for layers
+        self._store.prepare(self._layers_path)
 
         # layer map allows access to layers by id while layer stack
         # maintains the order of layers in composition
         self._layer_map = {}
         self._layer_stack = []
 
-        # load layers from the filesystem
-        for id in os.listdir(self._layers_path):
-            id, path, _ = self.get_layer_info(id)
-            print(id, path)
-            layer = layer_initializer(id, path)
-            self.add_layer(layer)
+        # layers which are being prepared may be reserved in the map before
+        # they are inserted into the stack
+        self._reserved_layers = []
 
-        # now arrange the layers by index
-        self._arrange_layers_by_index()
-        self._recompute_layer_indices()
+        # the reasons why recently reserved layers failed to be prepared
+        self._failures = OrderedDict()
+
+        # the composite of the static layers at the bottom of the stack
+        # may be cached so that they need not be composed each frame
+        self._prefix_memory = None
+        self._prefix_length = 0
+
+        # the order of the layers is stored once for the whole stack as a
+        # list of layer ids (the index of each layer is derived from it)
+        self._order = Cache(f"{self._path}/order", {"layers": None}, sync=True)
+
+        # layers in storage are loaded in order so that a lazily loaded
+        # stack is brought up from the bottom
+        self._unloaded_layer_ids = self._find_stored_layers()
+        if not lazy:
+            self.load_layers()
+
+    def _find_stored_layers(self):
+        """
+        returns the ids of the layers in storage in stack order without
+        initializing the layers
+        """
+        # layers whose info was never written (e.g. power was cut while the
+        # layer was created) can not be loaded
+        stored = list(
+            id
+            for id in self._store.children(self._layers_path)
+            if self._store.exists(f"{self._layer_path_by_id(id)}/info")
+        )
+        order = self._order.get("layers")
+        if order is None:
+            order = []
+        ids = list(id for id in order if id in stored)
+
+        # layers missing from the stored order (e.g. stored before the order
+        # was kept per stack) are ordered by the index in their info
+        legacy = []
+        for id in stored:
+            if id in ids:
+                continue
+            index = None
+            serialized = self._store.load(f"{self._layer_path_by_id(id)}/info")
+            if serialized is not None:
+                try:
+                    index = json.loads(serialized).get("index")
+                except ValueError:
+                    pass
+            legacy.append((index is None, index if index is not None else 0, id))
+        legacy.sort()
+        ids.extend(id for _, _, id in legacy)
+
+        # the order only needs to be written when it was incomplete
+        if ids != order:
+            self._order.set("layers", ids)
+        return ids
+
+    def load_next_layer(self):
+        """
+        initialize the next layer from storage
+        returns False once there are no more layers to load
+        """
+        if len(self._unloaded_layer_ids) == 0:
+            return False
+        id, path, _ = self.get_layer_info(self._unloaded_layer_ids.pop(0))
+        print(id, path)
+        layer = self._layer_initializer(id, path)
+
+        # loading a layer moves it from the unloaded layers to the end of
+        # the loaded layers, which leaves the stored order unchanged
+        self._layer_stack.append(layer)
+        self._layer_map[str(layer.id)] = layer
+        self._recompute_layer_indices(persist=False)
+        self.invalidate_prefix()
+        return True
+
+    def load_layers(self):
+        """
+        initialize all remaining layers from storage
+        """
+        while self.load_next_layer():
+            pass
 
     def __getitem__(self, key):
         return self._layer_stack[key]
@@ -48,13 +132,46 @@ class Stack:
     def __len__(self):
         return len(self._layer_stack)
 
-    def _arrange_layers_by_index(self):
-        # sort the layers in the stack by index
-        self._layer_stack.sort(key=lambda layer: layer.info.get("index"))
-
-    def _recompute_layer_indices(self):
+    def _recompute_layer_indices(self, persist=True):
+        # indices are only held in memory while the order of the stack is
+        # stored once (including any layers which are not loaded yet)
         for idx, layer in enumerate(self._layer_stack):
             layer.set_index(idx)
+        if not persist:
+            return
+        order = list(str(layer.id) for layer in self._layer_stack)
+        order.extend(self._unloaded_layer_ids)
+        if order != self._order.get("layers"):
+            self._order.set("layers", order)
+
+    def invalidate_prefix(self):
+        """
+        discard the cached composite of the bottom layers
+        """
+        self._prefix_length = 0
+
+    def store_prefix(self, memory, length):
+        """
+        cache the composite of the given number of layers at the bottom of
+        the stack. each of these layers must be active and have cached output
+        """
+        if self._prefix_memory is None or len(self._prefix_memory) != len(memory):
+            self._prefix_memory = bytearray(len(memory))
+        self._prefix_memory[:] = memory
+        self._prefix_length = length
+
+    def cached_prefix_length(self):
+        """
+        the number of layers at the bottom of the stack whose composite is
+        held in the prefix memory, or zero when the composite is not valid
+        """
+        length = self._prefix_length
+        for idx in range(length):
+            layer = self._layer_stack[idx]
+            if not (layer.active and layer.cached):
+                self._prefix_length = 0
+                return 0
+        return length
 
     def _layer_path_by_id(self, id):
         return f"{self._layers_path}/{id}"
@@ -78,26 +195,100 @@ class Stack:
         self._layer_stack.append(layer)
         self._layer_map[str(layer.id)] = layer
         self._recompute_layer_indices()
+        self.invalidate_prefix()
+
+    def reserve_layer(self, layer):
+        """
+        make a layer which is not yet ready to render accessible by id
+        """
+        self._reserved_layers.append(layer)
+        self._layer_map[str(layer.id)] = layer
+
+    def add_reserved_layers(self, layers, replace=False):
+        """
+        insert reserved layers into the stack all at once when they are
+        ready, optionally replacing all the existing layers
+        layers whose reservation was withdrawn in the meantime are skipped
+        returns the inserted layers
+        """
+        layers = list(layer for layer in layers if layer in self._reserved_layers)
+        for layer in layers:
+            self._reserved_layers.remove(layer)
+
+        if replace:
+            for layer in self._layer_stack:
+                del self._layer_map[str(layer.id)]
+                layer.destroy_storage()
+            self._layer_stack = []
+
+        self._layer_stack.extend(layers)
+        self._recompute_layer_indices()
+        self.invalidate_prefix()
+        return layers
+
+    def is_reserved(self, layer):
+        """
+        True while a layer is reserved, i.e. it has not been inserted into
+        the stack nor had its reservation withdrawn
+        """
+        return layer in self._reserved_layers
+
+    def discard_reserved_layers(self, layers, reason=None):
+        """
+        withdraw the reservation and remove the storage of layers which
+        will not be inserted into the stack
+        when a reason is given it is remembered for a while as the reason
+        why the layers failed
+        """
+        for layer in layers:
+            if layer in self._reserved_layers:
+                self._reserved_layers.remove(layer)
+                del self._layer_map[str(layer.id)]
+                layer.destroy_storage()
+                if reason is not None:
+                    self._failures[str(layer.id)] = reason
+
+        # only the most recent failures are kept
+        while len(self._failures) > Stack.MAX_FAILURES:
+            del self._failures[next(iter(self._failures))]
+
+    def get_failure(self, id):
+        """
+        the reason why a recently reserved layer failed, or None
+        """
+        return self._failures.get(id)
 
     def move_layer_to_index(self, id, dest_idx):
         original_index = self._layer_map[id].index
+        if dest_idx < 0 or dest_idx >= len(self._layer_stack):
+            raise IndexError
         self._layer_stack.insert(dest_idx, self._layer_stack.pop(original_index))
         self._recompute_layer_indices()
+        self.invalidate_prefix()
 
     def clear_layers(self):
         """remove all layers"""
         self._layer_stack = []
         self._layer_map = {}
-        rmdirr(self._layers_path)
-        os.mkdir(self._layers_path)
+        self._reserved_layers = []
+        self._failures = OrderedDict()
+        self._unloaded_layer_ids = []
+        self._order.set("layers", [])
+        self.invalidate_prefix()
+        self._store.remove(self._layers_path)
+        self._store.prepare(self._layers_path)
 
     def remove_layer_by_id(self, layerid):
         layer = self.get_layer_by_id(layerid)
-        layer_index = layer.info.get("index")
 
-        # remove the layer by its index
-        self._layer_stack.pop(layer_index)
-        self._recompute_layer_indices()
+        if layer in self._reserved_layers:
+            # reserved layers are not yet in the stack
+            self._reserved_layers.remove(layer)
+        else:
+            # remove the layer by its index
+            self._layer_stack.pop(layer.index)
+            self._recompute_layer_indices()
+            self.invalidate_prefix()
 
         # remove the layer from the map
         del self._layer_map[layerid]
@@ -105,6 +296,35 @@ class Stack:
         # remove storage
         layer.destroy_storage()
 
+    def snapshot(self, shard_hash=None):
+        """
+        returns a document describing every layer in the stack (in order)
+        which may be used to restore the stack later
+        shard_hash may be given to record the content hash of the shard used
+        by each layer so that it can be verified on restore
+        """
+        layers = []
+        for layer in self._layer_stack:
+            layer_snapshot = layer.snapshot()
+            if shard_hash is not None:
+                layer_snapshot["shard_hash"] = shard_hash(
+                    layer_snapshot["config"]["shard_uuid"]
+                )
+            layers.append(layer_snapshot)
+        return {
+            "version": Stack.SNAPSHOT_VERSION,
+            "id": self._id,
+            "layers": layers,
+        }
+
+    @property
+    def loaded(self):
+        return len(self._unloaded_layer_ids) == 0
+
+    @property
+    def prefix_memory(self):
+        return self._prefix_memory
+
     @property
     def id(self):
         return self._id
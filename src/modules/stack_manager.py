@@ -2,11 +2,12 @@ import stack
 
 
 class StackManager:
-    def __init__(self, path, layer_initializer):
+    def __init__(self, path, layer_initializer, lazy=False):
         from cache import Cache
 
-        self._stackA = stack.Stack(f"{path}/", "A", layer_initializer)
-        self._stackB = stack.Stack(f"{path}/", "B", layer_initializer)
+        # lazily created stacks load their layers when load() is run
+        self._stackA = stack.Stack(f"{path}/", "A", layer_initializer, lazy)
+        self._stackB = stack.Stack(f"{path}/", "B", layer_initializer, lazy)
 
         self._stacks = {
             "A": self._stackA,
@@ -60,6 +61,30 @@ class StackManager:
         else:
             self.activate("A")
 
+    def load_next_layer(self):
+        """
+        initialize the next layer of the active stack, or of the inactive
+        stack once the active stack is loaded
+        returns False once both stacks are loaded
+        """
+        if self._active.load_next_layer():
+            return True
+        return self._inactive.load_next_layer()
+
+    def load_layers(self):
+        while self.load_next_layer():
+            pass
+
+    async def load(self):
+        """
+        load the layers of lazily created stacks one at a time so that the
+        active stack is shown as it is brought up
+        """
+        import uasyncio as asyncio
+
+        while self.load_next_layer():
+            await asyncio.sleep(0)
+
     @property
     def active(self):
         return self._active
@@ -74,4 +99,7 @@ class StackManager:
 
     @property
     def stacks(self):
+        # layers are not loaded here, which would stall whoever asked
+        # (lazily created stacks are loaded by the load() task, see
+        # Stack.loaded)
         return self._stacks
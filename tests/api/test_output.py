@@ -0,0 +1,84 @@
+import time
+
+import pytest
+
+from tests.fixtures import api_client, TEST_SHARD_UUID, TEST_SHARD
+from tools import api_v0
+
+def active_stack_id(client):
+    return api_v0.get_output_info(client)["stacks"]["active"]
+
+def wait_until_ready(client, stack_id, layer_ids, timeout=5.0):
+    deadline = time.time() + timeout
+    for layer_id in layer_ids:
+        while api_v0.get_stack_layer_info(client, stack_id, layer_id)["state"] != "ready":
+            assert time.time() < deadline
+            time.sleep(0.05)
+
+def add_test_layers(client, stack_id, count, replace=False):
+    api_v0.put_shard(client, TEST_SHARD_UUID, TEST_SHARD)
+    layers = list({"config": {"shard_uuid": TEST_SHARD_UUID}} for _ in range(count))
+    pending = api_v0.post_stack_layers(client, stack_id, layers, replace)["pending"]
+    wait_until_ready(client, stack_id, pending)
+    return pending
+
+def test_layers_replace(api_client):
+    stack_id = active_stack_id(api_client)
+    add_test_layers(api_client, stack_id, 1)
+    ids = add_test_layers(api_client, stack_id, 2, replace=True)
+    assert api_v0.get_stack_info(api_client, stack_id)["layers"]["ids"] == ids
+
+def test_stack_profile(api_client):
+    stack_id = active_stack_id(api_client)
+    ids = add_test_layers(api_client, stack_id, 1, replace=True)
+    profile = api_v0.get_stack_profile(api_client, stack_id)
+    assert profile["id"] == stack_id
+    assert profile["units"] == "us"
+    assert list(profile["layers"].keys()) == ids
+    assert "total" in profile["layers"][ids[0]].keys()
+
+def test_snapshot_roundtrip(api_client):
+    stack_id = active_stack_id(api_client)
+    add_test_layers(api_client, stack_id, 2, replace=True)
+    snapshot = api_v0.get_stack_snapshot(api_client, stack_id)
+    assert snapshot["version"] == 1
+    assert len(snapshot["layers"]) == 2
+    for layer in snapshot["layers"]:
+        assert layer["config"]["shard_uuid"] == TEST_SHARD_UUID
+        assert type(layer["shard_hash"]) == str
+
+    pending = api_v0.put_stack_snapshot(api_client, stack_id, snapshot)["pending"]
+    wait_until_ready(api_client, stack_id, pending)
+    restored = api_v0.get_stack_snapshot(api_client, stack_id)
+    assert restored["layers"] == snapshot["layers"]
+
+def test_snapshot_shard_mismatch(api_client):
+    stack_id = active_stack_id(api_client)
+    add_test_layers(api_client, stack_id, 1, replace=True)
+    snapshot = api_v0.get_stack_snapshot(api_client, stack_id)
+    snapshot["layers"][0]["shard_hash"] = "0" * 64
+    with pytest.raises(Exception, match="409"):
+        api_v0.put_stack_snapshot(api_client, stack_id, snapshot)
+
+def test_transition(api_client):
+    info = api_v0.get_output_info(api_client)["stacks"]
+    source = info["active"]
+    target = next(id for id in info["ids"] if id != source)
+
+    transition = api_v0.start_transition(api_client, target, duration_ms=60000)
+    assert transition["transition"]["from"] == source
+    assert transition["transition"]["to"] == target
+    assert api_v0.get_transition(api_client)["transition"]["to"] == target
+
+    # activating a stack cancels the running transition
+    api_v0.activate_stack(api_client, source)
+    transition = api_v0.get_transition(api_client)
+    assert transition["transition"] is None
+    assert transition["active"] == source
+
+def test_transition_duration_validation(api_client):
+    info = api_v0.get_output_info(api_client)["stacks"]
+    target = next(id for id in info["ids"] if id != info["active"])
+    for duration_ms in ("soon", None, 0):
+        with pytest.raises(Exception, match="400"):
+            api_v0.start_transition(api_client, target, duration_ms=duration_ms)
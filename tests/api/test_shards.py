@@ -0,0 +1,16 @@
+import hashlib
+
+from tests.fixtures import api_client, TEST_SHARD_UUID, TEST_SHARD
+from tools import api_v0
+
+def test_shards_listing(api_client):
+    api_v0.put_shard(api_client, TEST_SHARD_UUID, TEST_SHARD)
+    info = api_v0.get_shard_info(api_client)
+    assert info["total"] == len(info["edges"])
+
+    nodes = dict((edge["cursor"], edge["node"]) for edge in info["edges"])
+    assert TEST_SHARD_UUID in nodes.keys()
+    node = nodes[TEST_SHARD_UUID]
+    assert node["hash"] == hashlib.sha256(TEST_SHARD.encode()).hexdigest()
+    assert node["size"] == len(TEST_SHARD)
+    assert type(node["refcount"]) == int
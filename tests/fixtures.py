@@ -1,7 +1,16 @@
 import pytest
 
-from tools.skies import CitySkiesClient
+from tools.api_v0 import HttpClient
+
+# a shard which the api tests upload and use for their layers
+TEST_SHARD_UUID = "test_api_shard"
+TEST_SHARD = "def frames(layer):\n    while True:\n        yield None\n"
 
 @pytest.fixture
 def client():
+    from tools.skies import CitySkiesClient
     return CitySkiesClient("localhost", 1337)
+
+@pytest.fixture
+def api_client():
+    return HttpClient("localhost", 1337)
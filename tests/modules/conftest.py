@@ -0,0 +1,9 @@
+import os
+import sys
+
+# the modules are written for micropython, the pure python ones among them
+# are tested here directly
+# (appended so that modules such as logging do not shadow the standard library)
+root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(root, "src", "modules"))
+sys.path.append(os.path.join(root, "ports", "unix", "modules"))
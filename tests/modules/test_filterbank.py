@@ -0,0 +1,94 @@
+import importlib.util
+import math
+import os
+import random
+
+import pytest
+
+# the audio package needs the native modules, the filterbank itself does not
+spec = importlib.util.spec_from_file_location(
+    "filterbank",
+    os.path.join(
+        os.path.dirname(__file__),
+        "..", "..", "src", "modules", "hidden_shades", "audio", "filterbank.py",
+    ),
+)
+filterbank = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(filterbank)
+Filterbank = filterbank.Filterbank
+
+def reshape(factor, floor, spectrum, length):
+    # the native reshape module
+    output = []
+    progress = 0.0
+    low = 0
+    high = 0
+    total = 0.0
+    for idx in range(length):
+        progress += math.pow(idx + 1, factor) - math.pow(idx, factor)
+        if int(progress) > high:
+            low = high
+            high = int(progress)
+            total = 0.0
+            for value in spectrum[low : min(high, len(spectrum))]:
+                if value > floor:
+                    total += value
+        output.append(total)
+    return output
+
+def align(bins, width):
+    # the native FloatBuffer.align
+    output = []
+    for idx in range(width):
+        phase = idx / (width - 1)
+        if len(bins) == 1 or phase <= 0.0:
+            output.append(bins[0])
+            continue
+        if phase >= 1.0:
+            output.append(bins[-1])
+            continue
+        center = phase * (len(bins) - 1)
+        lower = math.floor(center)
+        upper = math.ceil(center)
+        delta = center - lower
+        output.append(bins[lower] + (bins[upper] - bins[lower]) * delta)
+    return output
+
+def project(bank, spectrum, width, floor):
+    # the native FloatBuffer.project applied with the filterbank's tables
+    output = []
+    for row in range(width):
+        total = 0.0
+        for entry in range(bank._starts[row], bank._starts[row + 1]):
+            value = spectrum[bank._indices[entry]]
+            if floor is not None and value <= floor:
+                continue
+            total += bank._weights[entry] * value
+        output.append(total)
+    return output
+
+@pytest.mark.parametrize("factor", (1.0, 1.5, 2.0))
+@pytest.mark.parametrize("window", ((0, 256), (10, 100), (200, 256)))
+@pytest.mark.parametrize("width", (2, 16, 64, 300))
+def test_matches_reshape_and_align(factor, window, width):
+    num_bins = 256
+    floor = 0.1
+    rng = random.Random(0)
+    spectrum = list(rng.random() for _ in range(num_bins))
+
+    reshaped = reshape(factor, floor, spectrum, num_bins)
+    expected = align(reshaped[window[0] : window[1]], width)
+
+    bank = Filterbank(num_bins, factor, window, width)
+    columns = project(bank, spectrum, width, floor)
+    for value, reference in zip(columns, expected):
+        assert value == pytest.approx(reference, rel=1e-4, abs=1e-4)
+
+def test_tables_beyond_16_bits():
+    bank = Filterbank(4096, 2.0, (0, 64), 2048)
+    assert bank._starts[-1] > 0xFFFF
+    assert list(bank._starts) == sorted(bank._starts)
+
+def test_too_many_bins():
+    with pytest.raises(ValueError):
+        Filterbank(Filterbank.MAX_BINS + 1, 1.0, (0, 16), 16)
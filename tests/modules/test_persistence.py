@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+from persistence import LogStore
+
+ROOT = "store"
+
+def open_store(**kwargs):
+    # stores without a log are migrated from the file tree, which needs
+    # micropython's os.ilistdir, so the tests start from an empty log
+    try:
+        open(f"{ROOT}/{LogStore.LOG_NAME}", "x").close()
+    except FileExistsError:
+        pass
+    return LogStore(ROOT, **kwargs)
+
+def log_records():
+    with open(f"{ROOT}/{LogStore.LOG_NAME}") as f:
+        return list(json.loads(line) for line in f)
+
+@pytest.fixture(autouse=True)
+def in_tmp_path(tmp_path, monkeypatch):
+    # the store root must be relative (see pathutils.ensure_dirs)
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / ROOT).mkdir()
+
+def test_append_and_reload():
+    store = open_store()
+    store.save(f"{ROOT}/a/info", lambda: "1")
+    store.save(f"{ROOT}/b/info", lambda: "2")
+    assert log_records() == []
+    store.flush()
+    assert log_records() == [["a/info", "1"], ["b/info", "2"]]
+
+    store.save(f"{ROOT}/a/info", lambda: "3")
+    store.flush()
+    assert len(log_records()) == 3
+
+    reloaded = open_store()
+    assert reloaded.load(f"{ROOT}/a/info") == "3"
+    assert reloaded.load(f"{ROOT}/b/info") == "2"
+    assert reloaded.children(ROOT) == ["a", "b"]
+
+def test_sync_save_is_written_immediately():
+    store = open_store()
+    store.save(f"{ROOT}/a/info", lambda: "1", sync=True)
+    assert log_records() == [["a/info", "1"]]
+
+def test_remove():
+    store = open_store()
+    store.save(f"{ROOT}/a/info", lambda: "1")
+    store.save(f"{ROOT}/a/vars", lambda: "2")
+    store.save(f"{ROOT}/b/info", lambda: "3")
+    store.flush()
+    store.remove(f"{ROOT}/a")
+    assert not store.exists(f"{ROOT}/a")
+
+    reloaded = open_store()
+    assert reloaded.load(f"{ROOT}/a/info") is None
+    assert not reloaded.exists(f"{ROOT}/a")
+    assert reloaded.load(f"{ROOT}/b/info") == "3"
+
+def test_compaction():
+    store = open_store(compaction_ratio=2, compaction_minimum=4)
+    for value in range(10):
+        store.save(f"{ROOT}/a/info", lambda value=value: str(value))
+        store.flush()
+        assert len(log_records()) <= 4
+    assert log_records()[-1] == ["a/info", "9"]
+    assert open_store().load(f"{ROOT}/a/info") == "9"
+
+def test_torn_record_recovery():
+    store = open_store()
+    for name in ("a", "b"):
+        store.save(f"{ROOT}/{name}/info", lambda name=name: name)
+    store.flush()
+
+    # power is cut while a record is appended
+    with open(f"{ROOT}/{LogStore.LOG_NAME}", "a") as f:
+        f.write('["c/info", "c')
+
+    recovered = open_store()
+    assert log_records() == [["a/info", "a"], ["b/info", "b"]]
+
+    # records appended after the recovery are intact
+    recovered.save(f"{ROOT}/d/info", lambda: "d")
+    recovered.flush()
+    reloaded = open_store()
+    for name in ("a", "b", "d"):
+        assert reloaded.load(f"{ROOT}/{name}/info") == name
+    assert reloaded.load(f"{ROOT}/c/info") is None
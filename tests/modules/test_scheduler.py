@@ -0,0 +1,90 @@
+import asyncio
+import sys
+
+import pytest
+
+class FakeClock:
+    """
+    stands in for the micropython time and uasyncio functions used by the
+    scheduler, so that time only passes while the scheduler waits
+    """
+
+    def __init__(self):
+        self.now = 0
+        self.sleeps = []
+
+    def ticks_us(self):
+        return self.now
+
+    def ticks_add(self, ticks, delta):
+        return ticks + delta
+
+    def ticks_diff(self, a, b):
+        return a - b
+
+    async def sleep_ms(self, ms):
+        self.sleeps.append(ms)
+        self.now += ms * 1000
+
+    async def sleep(self, seconds):
+        # yielding to other tasks takes a little time
+        self.now += 10
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setitem(sys.modules, "uasyncio", clock)
+    monkeypatch.delitem(sys.modules, "scheduler", raising=False)
+    import scheduler
+
+    monkeypatch.setattr(scheduler, "time", clock)
+    monkeypatch.setattr(scheduler, "asyncio", clock)
+    return clock
+
+def run_frames(scheduler, count):
+    async def frames():
+        for _ in range(count):
+            await scheduler.wait()
+
+    asyncio.run(frames())
+
+def test_sleeps_until_shortly_before_the_deadline(clock):
+    from scheduler import FrameScheduler
+
+    scheduler = FrameScheduler(60, margin_us=1000)
+    run_frames(scheduler, 1)
+
+    # a 60 Hz period is 16666.67 us, the last millisecond is yielded away
+    assert clock.sleeps == [15]
+    assert 16666 <= clock.now < 16666 + 10
+
+def test_deadlines_do_not_drift(clock):
+    from scheduler import FrameScheduler
+
+    scheduler = FrameScheduler(60)
+    run_frames(scheduler, 600)
+
+    # the fractional microseconds of each period are carried forward
+    assert 10000000 <= clock.now < 10000000 + 10
+    assert scheduler.missed == 0
+
+def test_late_frames_are_skipped(clock):
+    from scheduler import FrameScheduler
+
+    scheduler = FrameScheduler(60)
+    clock.now = 5 * 16667
+    run_frames(scheduler, 1)
+    assert scheduler.missed == 4
+    assert clock.sleeps == []
+
+def test_frequency_change(clock):
+    from scheduler import FrameScheduler
+
+    scheduler = FrameScheduler(60)
+    scheduler.set_frequency(100)
+    assert scheduler.frequency == 100
+    run_frames(scheduler, 100)
+    assert 1000000 <= clock.now < 1000000 + 10
+
+    with pytest.raises(ValueError):
+        scheduler.set_frequency(0)
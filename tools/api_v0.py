@@ -2,8 +2,13 @@
 # PUT       /api/v0/shards/<uuid>
 
 # GET       /api/v0/output
+# GET       /api/v0/output/transition
+# PUT       /api/v0/output/transition
 # GET       /api/v0/output/stack/<stack_id>
 # PUT       /api/v0/output/stack/<stack_id>/activate
+# GET       /api/v0/output/stack/<stack_id>/profile
+# GET       /api/v0/output/stack/<stack_id>/snapshot
+# PUT       /api/v0/output/stack/<stack_id>/snapshot
 # GET       /api/v0/output/stack/<stack_id>/layers
 # DELETE    /api/v0/output/stack/<stack_id>/layers
 # POST      /api/v0/output/stack/<stack_id>/layers
@@ -70,24 +75,44 @@ def delete(client, path):
 def get_shard_info(client):
     return json_from_response(get(client, "/api/v0/shards"))
 
+def put_shard(client, uuid, source):
+    return json_from_response(put(client, f"/api/v0/shards/{uuid}", source))
+
 def get_output_info(client):
     return json_from_response(get(client, "/api/v0/output"))
 
+def get_transition(client):
+    return json_from_response(get(client, "/api/v0/output/transition"))
+
+def start_transition(client, stack_id, duration_ms=1000, curve="linear"):
+    data = json.dumps({"stack": stack_id, "duration_ms": duration_ms, "curve": curve})
+    return json_from_response(put(client, "/api/v0/output/transition", data))
+
 def get_stack_info(client, stack_id):
     return json_from_response(get(client, f"/api/v0/output/stack/{stack_id}"))
 
 def activate_stack(client, stack_id):
     return json_from_response(put(client, f"/api/v0/output/stack/{stack_id}/activate", ""))
 
+def get_stack_profile(client, stack_id):
+    return json_from_response(get(client, f"/api/v0/output/stack/{stack_id}/profile"))
+
+def get_stack_snapshot(client, stack_id):
+    return json_from_response(get(client, f"/api/v0/output/stack/{stack_id}/snapshot"))
+
+def put_stack_snapshot(client, stack_id, snapshot):
+    return json_from_response(put(client, f"/api/v0/output/stack/{stack_id}/snapshot", json.dumps(snapshot)))
+
 def get_stack_layers_info(client, stack_id):
     return json_from_response(get(client, f"/api/v0/output/stack/{stack_id}/layers"))
 
 def delete_stack_layers(client, stack_id):
     return json_from_response(delete(client, f"/api/v0/output/stack/{stack_id}/layers"))
 
-def post_stack_layers(client, stack_id, layers):
+def post_stack_layers(client, stack_id, layers, replace=False):
     data = json.dumps({"layers": layers})
-    return json_from_response(post(client, f"/api/v0/output/stack/{stack_id}/layers", data))
+    query = "?replace=true" if replace else ""
+    return json_from_response(post(client, f"/api/v0/output/stack/{stack_id}/layers{query}", data))
 
 def post_stack_layer(client, stack_id, shard_uuid):
     data = json.dumps({"config": {"shard_uuid": shard_uuid}})